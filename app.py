@@ -1,16 +1,22 @@
-from flask import Flask, render_template, redirect, url_for, request, session, jsonify
-import sqlite3
+from flask import Flask, render_template, redirect, url_for, request, session, jsonify, Response, stream_with_context, g, abort
 import json
+import click
 import random
-import plotly.graph_objs as go
-from textblob import TextBlob
-import requests
 import pyperclip
-from sentence_transformers import SentenceTransformer, util
 from dotenv import load_dotenv
 import os
-
-import topic_modeling
+import threading
+import time
+
+import content_generation
+import db
+import embeddings
+import jobs
+import llm_client
+import metrics
+import scheduler
+import scoring
+import vector_index
 
 app = Flask(__name__)
 app.secret_key = "your-secret-key"
@@ -18,51 +24,99 @@ app.secret_key = "your-secret-key"
 # Load environment variables
 load_dotenv()
 API_KEY = os.getenv("API_KEY")
+gemini = llm_client.GeminiClient(API_KEY)
 
 #############################################
 # Database & Helper Functions
 #############################################
 
 def get_db_connection():
-    conn = sqlite3.connect('data.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+    """This thread's shared connection to the current workspace's database; do not close it."""
+    return db.get_connection()
+
+def style_guide_key():
+    """Session key for the unconfirmed style guide, so each workspace keeps its own draft."""
+    workspace = db.current_workspace()
+    return "style_guide" if workspace == db.DEFAULT_WORKSPACE else f"style_guide:{workspace}"
+
+app.teardown_appcontext(db.release_connection)
+
+def start_services():
+    """Startup work for the serving process: schema, job recovery, scheduler and model warm-up."""
+    # Create or upgrade the schema once at startup instead of on every request.
+    db.init_db()
+    jobs.recover_interrupted_jobs()
+    # Periodic incremental refreshes of every workspace, when REFRESH_INTERVAL_MINUTES is set.
+    scheduler.start()
+    # Load the shared embedding model in the background so startup is not blocked on torch,
+    # and it is usually ready before the first request needs it.
+    if os.getenv("EMBEDDING_WARMUP", "1") == "1":
+        threading.Thread(target=embeddings.warm_up, name="embedding-warmup", daemon=True).start()
+
+# Process pool workers (forkserver/spawn) re-import the main script as __mp_main__;
+# they must not run a second scheduler or load the embedding model.
+if __name__ != "__mp_main__":
+    start_services()
 
-def ensure_company_details_table():
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute('''
-        CREATE TABLE IF NOT EXISTS company_details (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            company_name TEXT,
-            company_profile TEXT,
-            blogs TEXT,
-            keywords TEXT,
-            communities TEXT,
-            style_guide TEXT
-        )
-    ''')
-    conn.close()
+#############################################
+# Request Metrics and Profiling
+#############################################
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    if metrics.PROFILING_ENABLED and request.args.get("_profile") == "1":
+        g.profiler = metrics.RequestProfiler()
+        g.profiler.start()
+
+@app.after_request
+def record_request_metrics(response):
+    # Labelled by URL rule, not path, so /topic_summary/<topic> is one series.
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    metrics.HTTP_SECONDS.observe(
+        time.perf_counter() - g.get("request_start", time.perf_counter()),
+        method=request.method, route=route, status=response.status_code
+    )
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        profiler.stop()
+        mimetype, report = profiler.report()
+        return Response(report, mimetype=mimetype)
+    return response
 
 #############################################
-# Sentiment and Chart Generation
+# Topic Aggregates and Chart Generation
 #############################################
 
-def get_sentiment(text):
-    return TextBlob(text).sentiment.polarity
+def get_top_topics(conn, limit=15):
+    """(topic, post count) pairs for the most common topics, read from topic_stats."""
+    rows = conn.execute(
+        "SELECT name, post_count FROM topic_stats ORDER BY post_count DESC, name LIMIT ?", (limit,)
+    ).fetchall()
+    return [(row["name"], row["post_count"]) for row in rows]
 
-def generate_topic_chart(posts):
-    topic_counts = {}
-    for post in posts:
-        topic = post.get("topic") or "miscellaneous"
-        topics_list = [t.strip() for t in topic.split(",") if t.strip()]
-        if not topics_list:
-            topics_list = ["miscellaneous"]
-        for t in topics_list:
-            topic_counts[t] = topic_counts.get(t, 0) + 1
+# workspace -> (topic_stats version, chart) for the last chart built there; each entry is
+# replaced whole so readers never see a mix.
+_topic_chart_cache = {}
 
-    # Sort by count and get top 15 topics
-    sorted_topics = sorted(topic_counts.items(), key=lambda x: x[1], reverse=True)[:15]
+def get_topic_chart(conn, sorted_topics):
+    """
+    Return the chart for sorted_topics, rebuilding it only after topic_stats has been rewritten.
+    The version is read from the database, so writes from the topic pipeline invalidate it too.
+    """
+    workspace = db.current_workspace()
+    version = tuple(conn.execute("SELECT MAX(updated_at), COUNT(*) FROM topic_stats").fetchone())
+    cached_version, cached_chart = _topic_chart_cache.get(workspace, (None, None))
+    if cached_version == version:
+        metrics.cache_lookup("topic_chart", hits=1)
+        return cached_chart
+    metrics.cache_lookup("topic_chart", misses=1)
+    chart = generate_topic_chart(sorted_topics)
+    _topic_chart_cache[workspace] = (version, chart)
+    return chart
+
+def generate_topic_chart(sorted_topics):
+    import plotly.graph_objs as go
 
     # Extract topics and counts
     topics = [item[0] for item in sorted_topics]
@@ -104,100 +158,118 @@ def generate_topic_chart(posts):
 def get_confirmed_style_guide():
     conn = get_db_connection()
     company = conn.execute("SELECT style_guide FROM company_details ORDER BY id DESC LIMIT 1").fetchone()
-    conn.close()
     if company and company["style_guide"]:
         return company["style_guide"]
     return None
 
-def generate_ai_response_with_style(prompt_text):
-    endpoint = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash:generateContent?key={API_KEY}"
-    headers = {"Content-Type": "application/json"}
-    data = {"contents": [{"parts": [{"text": prompt_text}]}]}
-    try:
-        response = requests.post(endpoint, headers=headers, json=data, timeout=60)
-        response.raise_for_status()
-        result = response.json()
-        candidates = result.get("candidates", [])
-        if candidates:
-            return candidates[0]["content"]["parts"][0]["text"]
-        else:
-            return "No response generated."
-    except Exception as e:
-        print("Error generating AI response:", e)
-        return f"Error: {e}"
+def generate_ai_response_with_style(prompt_text, use_cache=False):
+    """
+    Generate text with Gemini through the shared pooled client.
+    Raises llm_client.LLMError instead of returning an error string as content.
+    """
+    return gemini.generate(prompt_text, use_cache=use_cache)
 
 #############################################
 # Similarity Score Calculations
 #############################################
 
-def calculate_response_alignment_score(generated_post, style_guide):
-    model = SentenceTransformer('all-MiniLM-L6-v2')
-    gen_embedding = model.encode(generated_post, convert_to_tensor=True)
-    style_embedding = model.encode(style_guide, convert_to_tensor=True)
-    similarity_score = util.pytorch_cos_sim(gen_embedding, style_embedding).item()
+def calculate_response_alignment_score(generated_post, style_guide, gen_embedding=None):
+    if gen_embedding is None:
+        gen_embedding = embeddings.encode(generated_post, use_cache=False)
+    style_embedding = embeddings.encode(style_guide)
+    similarity_score = float(scoring.normalize_rows(gen_embedding)[0] @ scoring.normalize_rows(style_embedding)[0])
     return round(similarity_score * 100, 2)
 
-def calculate_discussion_alignment_score(generated_post, related_texts):
-    model = SentenceTransformer('all-MiniLM-L6-v2')
-    gen_embedding = model.encode(generated_post, convert_to_tensor=True)
-    discussion_embedding = model.encode(related_texts, convert_to_tensor=True)
-    similarity_score = util.pytorch_cos_sim(gen_embedding, discussion_embedding).item()
-    return round(similarity_score * 100, 2)
+def calculate_discussion_alignment_score(generated_post, related_posts, gen_embedding=None, aggregation=None):
+    """
+    Alignment with the related discussion, scored chunk by chunk rather than as one
+    truncated blob. aggregation is 'max', 'mean' or 'topk' (see scoring.py).
+    """
+    if gen_embedding is None:
+        gen_embedding = embeddings.encode(generated_post, use_cache=False)
+    chunk_vectors = scoring.discussion_chunk_vectors(related_posts)
+    return scoring.discussion_alignment_scores(gen_embedding, chunk_vectors, aggregation)[0]
 
 #############################################
 # Routes
 #############################################
 
+# Rows rendered with the dashboard; further pages are fetched from /api/posts as needed.
+POSTS_PAGE_SIZE = 50
+MAX_POSTS_PAGE_SIZE = 200
+
 @app.route("/")
 def index():
     conn = get_db_connection()
-    posts = conn.execute("SELECT * FROM posts").fetchall()
-    conn.close()
-
-    posts_with_sentiment = []
-    for post in posts:
-        post_dict = dict(post)
-        if post_dict.get("ai_response"):
-            post_dict["sentiment"] = get_sentiment(post_dict["ai_response"])
-        else:
-            post_dict["sentiment"] = None
-        posts_with_sentiment.append(post_dict)
-    
-    topic_chart = generate_topic_chart(posts_with_sentiment)
-    
-    topic_counts = {}
-    for post in posts_with_sentiment:
-        topic_field = post.get("topic") or "miscellaneous"
-        topics_list = [t.strip() for t in topic_field.split(",") if t.strip()]
-        if not topics_list:
-            topics_list = ["miscellaneous"]
-        for t in topics_list:
-            topic_counts[t] = topic_counts.get(t, 0) + 1
-    
-    sorted_topics = sorted(topic_counts.items(), key=lambda x: x[1], reverse=True)[:15]
+    posts, next_cursor = db.page_posts(conn, limit=POSTS_PAGE_SIZE)
+
+    # Topic counts come from the materialized topic_stats table, not a pass over every post.
+    sorted_topics = get_top_topics(conn)
+    topic_chart = get_topic_chart(conn, sorted_topics)
     
     return render_template(
         "index.html",
-        posts=posts_with_sentiment,
+        posts=posts,
+        next_cursor=next_cursor,
+        page_size=POSTS_PAGE_SIZE,
         topic_chart=topic_chart,
         sorted_topics=sorted_topics
     )
 
-@app.route("/generate_post", methods=["POST"])
-def generate_post():
-    style_guide = get_confirmed_style_guide()
-    if not style_guide:
-        return jsonify({"error": "No style guide found. Please set up your company profile."}), 400
+def query_arg(name, convert):
+    """An optional query parameter converted with convert; a value that does not parse raises ValueError."""
+    value = request.args.get(name)
+    if value is None:
+        return None
+    try:
+        return convert(value)
+    except ValueError:
+        raise ValueError(f"Invalid {name}: {value!r}") from None
 
-    platform = request.json.get("platform", "blog")
-    platform_instructions = {
-        "blog": "Generate a detailed blog post with a clear structure, engaging introduction, and call-to-action.",
-        "linkedin": "Generate a professional LinkedIn post that is concise, value-driven, and engaging for professionals.",
-        "twitter": "Generate a short and engaging tweet within 280 characters that captures attention quickly."
-    }
+@app.route("/api/posts")
+def api_posts():
+    """
+    A page of posts as JSON, ordered by id with keyset pagination:
+    /api/posts?after=<next_cursor>&limit=50&fields=id,post_title&topic=...&min_sentiment=-0.5&max_sentiment=1&order=desc
+    Comments are only included when listed in `fields`.
+    """
+    try:
+        after = query_arg("after", int)
+        limit = query_arg("limit", int)
+        limit = max(1, min(POSTS_PAGE_SIZE if limit is None else limit, MAX_POSTS_PAGE_SIZE))
+        min_sentiment = query_arg("min_sentiment", float)
+        max_sentiment = query_arg("max_sentiment", float)
+        fields = request.args.get("fields")
+        columns = [f.strip() for f in fields.split(",") if f.strip()] if fields else db.DEFAULT_POST_COLUMNS
+        posts, next_cursor = db.page_posts(
+            get_db_connection(),
+            after=after,
+            limit=limit,
+            columns=columns,
+            topic=request.args.get("topic"),
+            min_sentiment=min_sentiment,
+            max_sentiment=max_sentiment,
+            descending=request.args.get("order") == "desc"
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({
+        "posts": [dict(post) for post in posts],
+        "next_cursor": next_cursor
+    })
 
-    # Select the most popular topic
+@app.route("/api/posts/<int:post_id>")
+def api_post(post_id):
+    """One post with every field, comments included."""
     conn = get_db_connection()
+    columns = [column for column in db.POST_COLUMNS if column != "comments"]
+    post = conn.execute(f"SELECT {', '.join(columns)} FROM posts WHERE id = ?", (post_id,)).fetchone()
+    if post is None:
+        return jsonify({"error": "Post not found"}), 404
+    return jsonify(dict(post, comments=db.post_comments_text(conn, post_id)))
+
+def select_top_topic(conn):
+    """The most common topic label, or 'general' before topic modeling has run."""
     topic_data = conn.execute("""
         SELECT topic, COUNT(*) as count 
         FROM posts 
@@ -206,38 +278,66 @@ def generate_post():
         ORDER BY count DESC 
         LIMIT 1
     """).fetchone()
-    conn.close()
+    return topic_data["topic"] if topic_data else "general"
 
-    selected_topic = topic_data["topic"] if topic_data else "general"
+# Related posts a generated post's discussion alignment is scored against.
+RELATED_POSTS_K = int(os.getenv("RELATED_POSTS_K", "10"))
 
-    # Prepare AI prompt
-    prompt = (
-        f"Using the following brand style guide:\n{style_guide}\n\n"
-        f"Topic: {selected_topic}\n"
-        f"Platform: {platform}\n"
-        f"{platform_instructions.get(platform, 'Generate a general post.')}\n\n"
-        "Response:"
+def score_generated_post(generated_response, style_guide, selected_topic, aggregation=None):
+    """Return (response alignment score, discussion alignment score) for a generated post."""
+    gen_embedding = embeddings.encode(generated_response, use_cache=False)
+
+    # Calculate Response Alignment Score
+    response_alignment_score = calculate_response_alignment_score(
+        generated_response, style_guide, gen_embedding=gen_embedding
     )
 
-    # Generate AI response
-    generated_response = generate_ai_response_with_style(prompt)
+    # Calculate Discussion Alignment Score against the topic's posts closest to the output,
+    # falling back to every post of the topic until the vector index has been built.
+    related_posts = vector_index.similar_posts(
+        generated_response, k=RELATED_POSTS_K, label=selected_topic, query_vector=gen_embedding,
+        include_comments=True
+    )
+    if not related_posts:
+        conn = get_db_connection()
+        related_posts = list(db.with_comments(conn, conn.execute("""
+            SELECT id, post_title, post_content
+            FROM posts 
+            WHERE topic = ?
+        """, (selected_topic,))))
+
+    discussion_alignment_score = calculate_discussion_alignment_score(
+        generated_response, related_posts, gen_embedding=gen_embedding, aggregation=aggregation
+    )
+    return response_alignment_score, discussion_alignment_score
 
-    # Calculate Response Alignment Score
-    response_alignment_score = calculate_response_alignment_score(generated_response, style_guide)
+@app.route("/generate_post", methods=["POST"])
+def generate_post():
+    style_guide = get_confirmed_style_guide()
+    if not style_guide:
+        return jsonify({"error": "No style guide found. Please set up your company profile."}), 400
 
-    # Calculate Discussion Alignment Score
-    conn = get_db_connection()
-    related_texts = conn.execute("""
-        SELECT post_title, post_content, comments 
-        FROM posts 
-        WHERE topic LIKE ?
-    """, ('%' + selected_topic + '%',)).fetchall()
-    conn.close()
+    platform = request.json.get("platform", "blog")
+    aggregation = request.json.get("aggregation")
+    if aggregation not in (None, "max", "mean", "topk"):
+        return jsonify({"error": "aggregation must be 'max', 'mean' or 'topk'."}), 400
+
+    # Select the most popular topic
+    selected_topic = select_top_topic(get_db_connection())
+
+    # Prepare AI prompt
+    prompt = content_generation.build_post_prompt(style_guide, selected_topic, platform)
 
-    discussion_texts = " ".join(
-        [f"{post['post_title']} {post['post_content']} {post['comments']}" for post in related_texts]
+    # Generate AI response
+    try:
+        generated_response = generate_ai_response_with_style(prompt)
+    except llm_client.LLMError as e:
+        print("Error generating AI response:", e)
+        return jsonify({"error": f"Could not generate a post: {e}"}), 502
+
+    response_alignment_score, discussion_alignment_score = score_generated_post(
+        generated_response, style_guide, selected_topic, aggregation=aggregation
     )
-    discussion_alignment_score = calculate_discussion_alignment_score(generated_response, discussion_texts)
 
     # Return JSON with both scores
     return jsonify({
@@ -247,6 +347,111 @@ def generate_post():
         "discussion_alignment_score": discussion_alignment_score
     })
 
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.route("/generate_post/stream")
+def generate_post_stream():
+    """
+    Streaming variant of /generate_post as server-sent events:
+    'topic' first, then one 'token' event per Gemini chunk, then 'scores' once the
+    alignment scores are computed, and finally 'done' (or 'error').
+    """
+    style_guide = get_confirmed_style_guide()
+    if not style_guide:
+        return jsonify({"error": "No style guide found. Please set up your company profile."}), 400
+
+    platform = request.args.get("platform", "blog")
+    selected_topic = select_top_topic(get_db_connection())
+    prompt = content_generation.build_post_prompt(style_guide, selected_topic, platform)
+
+    workspace = db.current_workspace()
+
+    def events():
+        # The generator outlives the request, so re-enter its workspace here.
+        with db.use_workspace(workspace):
+            yield sse_event("topic", {"topic": selected_topic})
+            chunks = []
+            try:
+                for chunk in gemini.stream_generate(prompt):
+                    chunks.append(chunk)
+                    yield sse_event("token", {"text": chunk})
+            except llm_client.LLMError as e:
+                print("Error generating AI response:", e)
+                yield sse_event("error", {"error": f"Could not generate a post: {e}"})
+                return
+            response_alignment_score, discussion_alignment_score = score_generated_post(
+                "".join(chunks), style_guide, selected_topic
+            )
+            yield sse_event("scores", {
+                "response_alignment_score": response_alignment_score,
+                "discussion_alignment_score": discussion_alignment_score
+            })
+            yield sse_event("done", {})
+
+    return Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.route("/generate_batch", methods=["POST"])
+def generate_batch():
+    """
+    Generate posts for every requested platform about each of the top N topics in one call.
+    Body: {"platforms": ["blog", "linkedin", "twitter"], "top_n": 5, "concurrency": 4}
+    """
+    style_guide = get_confirmed_style_guide()
+    if not style_guide:
+        return jsonify({"error": "No style guide found. Please set up your company profile."}), 400
+
+    body = request.get_json(silent=True) or {}
+    platforms = body.get("platforms") or list(content_generation.PLATFORM_INSTRUCTIONS)
+    if not isinstance(platforms, list):
+        return jsonify({"error": "platforms must be a list."}), 400
+    unknown = [p for p in platforms if p not in content_generation.PLATFORM_INSTRUCTIONS]
+    if unknown:
+        return jsonify({"error": f"Unknown platforms: {', '.join(map(str, unknown))}"}), 400
+    try:
+        top_n = int(body.get("top_n", 5))
+        concurrency = int(body.get("concurrency", content_generation.BATCH_CONCURRENCY))
+    except (TypeError, ValueError):
+        return jsonify({"error": "top_n and concurrency must be integers."}), 400
+    if not 1 <= top_n <= content_generation.MAX_BATCH_TOP_N:
+        return jsonify({"error": f"top_n must be between 1 and {content_generation.MAX_BATCH_TOP_N}."}), 400
+    if concurrency < 1:
+        return jsonify({"error": "concurrency must be at least 1."}), 400
+
+    result = content_generation.generate_batch(
+        gemini,
+        style_guide,
+        platforms,
+        top_n=top_n,
+        # Clients may ask for less parallelism than the server allows, never more.
+        concurrency=min(concurrency, content_generation.BATCH_CONCURRENCY)
+    )
+    return jsonify(result)
+
+@app.cli.command("generate-batch")
+@click.option("--platforms", default="blog,linkedin,twitter", help="Comma-separated platforms.")
+@click.option("--top-n", default=5, show_default=True,
+              type=click.IntRange(1, content_generation.MAX_BATCH_TOP_N), help="Number of top topics.")
+@click.option("--concurrency", default=content_generation.BATCH_CONCURRENCY, show_default=True,
+              type=click.IntRange(min=1), help="Maximum simultaneous Gemini calls.")
+def generate_batch_command(platforms, top_n, concurrency):
+    """Generate a content calendar: every platform for each of the top N topics."""
+    style_guide = get_confirmed_style_guide()
+    if not style_guide:
+        raise click.ClickException("No style guide found. Please set up your company profile.")
+    result = content_generation.generate_batch(
+        gemini,
+        style_guide,
+        [p.strip() for p in platforms.split(",") if p.strip()],
+        top_n=top_n,
+        concurrency=concurrency
+    )
+    click.echo(json.dumps(result, indent=2))
+
 @app.route("/copy_post", methods=["POST"])
 def copy_post():
     content = request.form.get("content", "")
@@ -263,7 +468,6 @@ def edit_post():
 
 @app.route("/company_setup", methods=["GET", "POST"])
 def company_setup():
-    ensure_company_details_table()
     conn = get_db_connection()
     company = conn.execute("SELECT * FROM company_details ORDER BY id DESC LIMIT 1").fetchone()
     if request.method == "POST":
@@ -285,31 +489,26 @@ def company_setup():
                 VALUES (?, ?, ?, ?, ?)
             ''', (company_name, company_profile, blogs, keywords, communities))
         conn.commit()
-        conn.close()
-        session.pop('style_guide', None)
+        session.pop(style_guide_key(), None)
         return redirect(url_for('generate_prompt_style'))
-    conn.close()
     return render_template("company_setup.html", company=company)
 
 @app.route("/generate_prompt_style", methods=["GET", "POST"])
 def generate_prompt_style():
-    ensure_company_details_table()
     if request.method == "POST":
-        style = session.get('style_guide', '')
+        style = session.get(style_guide_key(), '')
         conn = get_db_connection()
         company = conn.execute("SELECT * FROM company_details ORDER BY id DESC LIMIT 1").fetchone()
         if company:
             conn.execute("UPDATE company_details SET style_guide = ? WHERE id = ?", (style, company["id"]))
             conn.commit()
-        conn.close()
         return redirect(url_for('index'))
     
-    if 'style_guide' in session:
-        style_guide = session['style_guide']
+    if style_guide_key() in session:
+        style_guide = session[style_guide_key()]
     else:
         conn = get_db_connection()
         company = conn.execute("SELECT * FROM company_details ORDER BY id DESC LIMIT 1").fetchone()
-        conn.close()
         if not company:
             return "No company details found. Please set up your company profile first."
         
@@ -322,36 +521,77 @@ def generate_prompt_style():
             "Based on the above details, generate a brand style guide that reflects the brand style of writing."
         )
         
-        style_guide = generate_ai_response_with_style(prompt_text)
-        session['style_guide'] = style_guide
+        # Cached per prompt, so revisiting with an unchanged company profile costs no API call.
+        try:
+            style_guide = generate_ai_response_with_style(prompt_text, use_cache=True)
+        except llm_client.LLMError as e:
+            print("Error generating AI response:", e)
+            return f"Could not generate a style guide: {e}", 502
+        session[style_guide_key()] = style_guide
 
     return render_template("generate_prompt_style.html", style_guide=style_guide)
 
 @app.route("/edit_style", methods=["GET", "POST"])
 def edit_style():
     if request.method == "POST":
-        session['style_guide'] = request.form["style_guide"]
+        session[style_guide_key()] = request.form["style_guide"]
         return redirect(url_for('generate_prompt_style'))
-    current_style = session.get('style_guide', '')
+    current_style = session.get(style_guide_key(), '')
     return render_template("edit_style.html", style_guide=current_style)
 
 @app.route("/topic_summary/<topic>")
 def topic_summary(topic):
     conn = get_db_connection()
     cur = conn.cursor()
-    posts = cur.execute("SELECT * FROM posts WHERE topic LIKE ?", ('%' + topic + '%',)).fetchall()
-    conn.close()
+    posts = cur.execute("""
+        SELECT p.*
+        FROM topics t
+        JOIN post_topics pt ON pt.topic_id = t.id
+        JOIN posts p ON p.id = pt.post_id
+        WHERE t.name = ?
+    """, (topic,)).fetchall()
     posts = [dict(post) for post in posts]
     
     if not posts:
         return f"No posts found for topic: {topic}"
     
-    total_posts = len(posts)
-    total_upvotes = sum(post["score"] if post["score"] is not None else 0 for post in posts)
-    total_comments = sum(post["num_comments"] if post["num_comments"] is not None else 0 for post in posts)
-    
-    combined_texts = " ".join([post["post_title"] + " " + (post["post_content"] or "") + " " + (post["comments"] or "") for post in posts])
-    avg_sentiment = TextBlob(combined_texts).sentiment.polarity if combined_texts else 0
+    # Totals and the per-post mean sentiment come from topic_stats, kept up to date on write.
+    stats = cur.execute("""
+        SELECT post_count, total_upvotes, total_comments, avg_sentiment
+        FROM topic_stats
+        WHERE name = ?
+    """, (topic,)).fetchone()
+    total_posts = stats["post_count"] if stats else len(posts)
+    total_upvotes = stats["total_upvotes"] if stats else 0
+    total_comments = stats["total_comments"] if stats else 0
+    avg_sentiment = (stats["avg_sentiment"] if stats else None) or 0
+
+    # Keyword weights and representative posts of the model topics labelled with this word,
+    # stored at the last refit.
+    model_topics = db.model_topics_for(conn, topic)
+    keywords = model_topics[0]["keywords"] if model_topics else []
+    posts_by_id = {post["id"]: post for post in posts}
+    representative_ids = [post_id for t in model_topics for post_id in t["representative_post_ids"]]
+
+    # Only as much text as the 150-character overview needs is joined, starting from the
+    # model's representative posts, else the posts closest to the topic itself when the
+    # vector index is available.
+    representative = (
+        [posts_by_id[post_id] for post_id in representative_ids if post_id in posts_by_id]
+        or vector_index.similar_posts(topic, k=3, topic=topic)
+        or posts
+    )
+    combined_texts = ""
+    for post in representative:
+        text = post["post_title"] + " " + (post["post_content"] or "")
+        # Comments are decompressed lazily, only while the overview is still short.
+        for _, body in db.iter_comment_bodies(conn, [post["id"]]):
+            if len(combined_texts) + len(text) > 150:
+                break
+            text += " " + body
+        combined_texts += (" " if combined_texts else "") + text
+        if len(combined_texts) > 150:
+            break
     summary = combined_texts[:150] + "..." if len(combined_texts) > 150 else combined_texts
 
     return render_template(
@@ -362,33 +602,139 @@ def topic_summary(topic):
         total_comments=total_comments,
         avg_sentiment=avg_sentiment,
         summary=summary,
+        keywords=keywords,
         posts=posts
     )
 
+@app.route("/similar_posts")
+def similar_posts():
+    """
+    The k posts nearest to ?q= in embedding space: /similar_posts?q=...&k=5[&topic=...]
+    """
+    query = request.args.get("q", "").strip()
+    if not query:
+        return jsonify({"error": "Missing query parameter 'q'."}), 400
+    k = max(1, min(request.args.get("k", 5, type=int), 100))
+    index = vector_index.get_index()
+    if index is None:
+        return jsonify({"error": "The vector index has not been built yet. Run topic modeling first."}), 503
+    return jsonify({
+        "query": query,
+        "backend": index.backend.name,
+        "posts": vector_index.similar_posts(query, k=k, topic=request.args.get("topic"))
+    })
+
+@app.route("/metrics")
+def metrics_endpoint():
+    """Prometheus scrape endpoint: route latency, pipeline stages, external calls and cache lookups."""
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+@app.route("/model_stats")
+def model_stats():
+    stats = embeddings.model_stats()
+    stats["llm"] = gemini.stats()
+    return jsonify(stats)
+
 #############################################
 # New Route to Run Topic Modeling
 #############################################
 @app.route("/run_topic_modeling")
 def run_topic_modeling_route():
     """
-    Reads the last-saved 'communities' from company_details,
-    calls run_topic_modeling using that as the subreddit name,
-    and returns a simple message or you can redirect to /
+    Reads the last-saved 'communities' from company_details and queues
+    run_topic_modeling on every subreddit listed there as a background job.
+    Returns the job id and the URL to poll for its progress. If a run is
+    already queued or in progress, that run is returned instead.
     """
-    ensure_company_details_table()
-    conn = get_db_connection()
-    company = conn.execute("SELECT * FROM company_details ORDER BY id DESC LIMIT 1").fetchone()
-    conn.close()
-    if not company:
+    # Every listed community is fetched, concurrently.
+    # Pass ?mode=full to wipe the posts table and refit from scratch.
+    incremental = request.args.get("mode", "incremental") != "full"
+    job, created = scheduler.enqueue_refresh(limit=50, incremental=incremental)
+    if job is None:
         return "No company details found. Please set up your company profile first."
+    return jsonify({
+        "job_id": job["id"],
+        "status": job["status"],
+        "already_running": not created,
+        "status_url": url_for("job_status", job_id=job["id"])
+    }), 202
+
+@app.route("/jobs")
+def list_jobs():
+    return jsonify(jobs.list_jobs())
+
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    job = jobs.get_job(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
 
-    # Assume the user typed something like "LocalLLaMA" or "AskReddit" in the communities field.
-    # If multiple communities are listed, take the first one.
-    communities_field = company["communities"] or "LocalLLaMA"
-    subreddit_name = communities_field.split(",")[0].strip()
+#############################################
+# Workspaces
+#############################################
+
+@app.route("/workspaces", methods=["GET", "POST"])
+def workspaces():
+    """GET lists the workspaces; POST {"name": ...} creates one (idempotent)."""
+    if request.method == "POST":
+        data = request.get_json(silent=True) or request.form
+        name = (data.get("name") or "").strip().lower()
+        try:
+            db.create_workspace(name)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        return jsonify({"name": name, "url": url_for("index", workspace=name)}), 201
+    return jsonify([
+        {"name": name, "url": url_for("index", workspace=name)} for name in db.list_workspaces()
+    ])
+
+@app.cli.command("create-workspace")
+@click.argument("name")
+def create_workspace_command(name):
+    """Create an empty workspace, served under /w/<name>/."""
+    try:
+        db.create_workspace(name)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+    print(f"Created workspace '{name}'.")
+
+# Every page and API route is also served under /w/<workspace>/, against that workspace's
+# database, topic model and vector index. The unprefixed routes are the default workspace.
+SHARED_ENDPOINTS = {"static", "metrics_endpoint", "workspaces"}
+for rule in list(app.url_map.iter_rules()):
+    if rule.endpoint not in SHARED_ENDPOINTS:
+        app.add_url_rule(
+            "/w/<workspace>" + rule.rule, endpoint=rule.endpoint,
+            methods=sorted(rule.methods - {"HEAD", "OPTIONS"})
+        )
 
-    topic_modeling.run_topic_modeling(subreddit_name=subreddit_name, limit=50)
-    return "Topic modeling completed successfully! Check the console logs for details."
+@app.url_value_preprocessor
+def enter_workspace(endpoint, values):
+    if not values or "workspace" not in values:
+        return
+    workspace = values.pop("workspace")
+    # Unknown names 404 rather than creating a database on first visit.
+    if not (db.valid_workspace_name(workspace) and db.workspace_exists(workspace)):
+        abort(404)
+    g.workspace_token = db.set_workspace(workspace)
+
+@app.url_defaults
+def add_workspace(endpoint, values):
+    # url_for() inside a workspace stays inside it; the default workspace has the bare URLs.
+    if values.get("workspace") == db.DEFAULT_WORKSPACE:
+        values.pop("workspace")
+        return
+    workspace = db.current_workspace()
+    if (workspace != db.DEFAULT_WORKSPACE and "workspace" not in values
+            and app.url_map.is_endpoint_expecting(endpoint, "workspace")):
+        values["workspace"] = workspace
+
+@app.teardown_request
+def leave_workspace(exception=None):
+    token = g.pop("workspace_token", None)
+    if token is not None:
+        db.reset_workspace(token)
 
 if __name__ == "__main__":
     app.run(debug=True)
@@ -0,0 +1,69 @@
+"""
+Import-time budget for the web app: runs `python -X importtime -c "import app"` in a
+fresh interpreter and fails if importing takes longer than the budget or pulls in any of
+the heavy ML modules that should only load when a job or route needs them.
+
+    python benchmarks/bench_startup.py --budget-ms 1500
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Top-level packages that must not be imported by `import app`.
+LAZY_MODULES = ("torch", "sentence_transformers", "transformers", "bertopic", "umap", "hdbscan",
+                "sklearn", "plotly", "praw", "nltk", "textblob", "hnswlib", "faiss")
+
+def measure_imports(module):
+    """[(module, self_us, cumulative_us)] from -X importtime, in import order."""
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(
+            os.environ,
+            DB_PATH=os.path.join(tmp, "data.db"),
+            EMBEDDING_WARMUP="0",
+            PYTHONDONTWRITEBYTECODE="1"
+        )
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=ROOT, env=env, capture_output=True, text=True
+        )
+    if result.returncode != 0:
+        sys.exit(f"import {module} failed:\n{result.stderr}")
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--module", default="app")
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("STARTUP_BUDGET_MS", "1500")))
+    parser.add_argument("--top", type=int, default=15, help="Slowest imports to list.")
+    args = parser.parse_args()
+
+    rows = measure_imports(args.module)
+    total_ms = next((cumulative for name, _, cumulative in rows if name == args.module), 0) / 1000
+    print(f"import {args.module}: {total_ms:.0f} ms (budget {args.budget_ms:.0f} ms)")
+    print("Slowest top-level imports:")
+    top_level = [row for row in rows if "." not in row[0]]
+    for name, _, cumulative in sorted(top_level, key=lambda row: -row[2])[:args.top]:
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+    failures = []
+    eager = sorted({name.split(".")[0] for name, _, _ in rows} & set(LAZY_MODULES))
+    if eager:
+        failures.append(f"heavy modules imported at startup: {', '.join(eager)}")
+    if total_ms > args.budget_ms:
+        failures.append(f"import took {total_ms:.0f} ms, over the {args.budget_ms:.0f} ms budget")
+    for failure in failures:
+        print("FAIL:", failure)
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
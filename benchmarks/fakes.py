@@ -0,0 +1,116 @@
+"""Offline stand-ins for Reddit, Gemini and the embedding model, used by the benchmarks."""
+import hashlib
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import numpy as np
+
+#############################################
+# Reddit
+#############################################
+
+class FakeReddit:
+    """
+    The slice of praw.Reddit that reddit_ingest.RedditFetcher uses, served from a dict of
+    posts by reddit_id instead of the network.
+    """
+
+    def __init__(self, posts_by_id):
+        self.posts_by_id = posts_by_id
+        self.auth = SimpleNamespace(limits={})
+
+    def subreddit(self, name):
+        posts = self.posts_by_id
+
+        def hot(limit):
+            return [
+                SimpleNamespace(
+                    id=post["reddit_id"], title=post["post_title"], selftext=post["post_content"],
+                    score=post["score"], num_comments=post["num_comments"]
+                )
+                for post in list(posts.values())[:limit]
+            ]
+        return SimpleNamespace(hot=hot)
+
+    def submission(self, id):
+        post = self.posts_by_id[id]
+        comments = [SimpleNamespace(id=f"{id}_c0", body=post["comments"], score=1, author=f"user_{id}")]
+        return SimpleNamespace(comments=FakeComments(comments))
+
+class FakeComments(list):
+    def replace_more(self, limit=0):
+        return []
+
+def fake_reddit_factory(posts):
+    """A client_factory for RedditFetcher whose clients all serve posts."""
+    posts_by_id = {post["reddit_id"]: post for post in posts}
+    return lambda settings: FakeReddit(posts_by_id)
+
+#############################################
+# Gemini
+#############################################
+
+STUB_RESPONSE = (
+    "Quantized models now fit on a single consumer GPU. Here is what changed this week, "
+    "what it means for local inference, and how to try it yourself."
+)
+
+class _GeminiHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if ":streamGenerateContent" in self.path:
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            for word in STUB_RESPONSE.split(" "):
+                chunk = {"candidates": [{"content": {"parts": [{"text": word + " "}]}}]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            return
+        body = json.dumps({"candidates": [{"content": {"parts": [{"text": STUB_RESPONSE}]}}]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class GeminiStubServer:
+    """Local generateContent / streamGenerateContent endpoint; use as a context manager."""
+
+    def __enter__(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _GeminiHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.api_base = f"http://127.0.0.1:{self.server.server_port}/v1beta"
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+#############################################
+# Embeddings
+#############################################
+
+class HashingEncoder:
+    """
+    Deterministic bag-of-words hashing vectors with the SentenceTransformer.encode
+    signature. Lets the pipeline be timed end to end where the real model is unavailable;
+    encode timings are then not representative.
+    """
+
+    def __init__(self, dim=384):
+        self.dim = dim
+
+    def encode(self, texts, show_progress_bar=False, **kwargs):
+        single = isinstance(texts, str)
+        texts = [texts] if single else texts
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in text.lower().split():
+                digest = hashlib.blake2b(word.encode(), digest_size=8).digest()
+                vectors[row, int.from_bytes(digest[:4], "little") % self.dim] += 1 if digest[4] & 1 else -1
+        return vectors[0] if single else vectors
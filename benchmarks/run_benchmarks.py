@@ -0,0 +1,271 @@
+"""
+End-to-end benchmark: ingestion, preprocessing, encoding, dimensionality reduction,
+clustering, topic write-back, vector index build and the dashboard routes, timed stage
+by stage on synthetic corpora with Reddit and Gemini stubbed out, so it runs offline.
+
+    python benchmarks/run_benchmarks.py --sizes 100,10000,100000
+    python benchmarks/run_benchmarks.py --sizes 100 --hashing-embeddings --output out.json
+
+Each corpus size runs in its own interpreter so peak RSS is per size. Results are written
+as JSON (default benchmarks/results/<timestamp>.json) for comparison across commits.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+from urllib.parse import quote
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+
+from fakes import GeminiStubServer, HashingEncoder, fake_reddit_factory
+from synthetic import synthetic_posts
+
+STYLE_GUIDE = "Friendly, technically precise, short paragraphs, no hype."
+
+#############################################
+# Helper Functions
+#############################################
+
+def rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+def peak_rss_bytes():
+    # ru_maxrss is in KiB on Linux and bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True
+        ).stdout.strip() or None
+    except OSError:
+        return None
+
+class StageTimer:
+    """Runs named stages, recording seconds, RSS afterwards and any error; a failed stage does not stop the run."""
+
+    def __init__(self):
+        self.stages = {}
+
+    def run(self, name, fn):
+        start = time.perf_counter()
+        try:
+            result = fn()
+            error = None
+        except Exception as e:
+            traceback.print_exc()
+            result, error = None, f"{type(e).__name__}: {e}"
+        record = {"seconds": round(time.perf_counter() - start, 4), "rss_bytes": rss_bytes()}
+        if error:
+            record["error"] = error
+        elif isinstance(result, dict):
+            record.update(result)
+        self.stages[name] = record
+        status = f"FAILED ({error})" if error else f"{record['seconds']:.3f}s"
+        print(f"[{name}] {status}", file=sys.stderr)
+        return result
+
+#############################################
+# One Corpus Size (child process)
+#############################################
+
+def run_size(size, hashing_embeddings):
+    """Time every stage for one corpus size in a scratch directory; returns the result dict."""
+    workdir = tempfile.mkdtemp(prefix=f"bench-{size}-")
+    with GeminiStubServer() as gemini_stub:
+        os.environ.update({
+            "DB_PATH": os.path.join(workdir, "data.db"),
+            "EMBEDDING_CACHE_PATH": os.path.join(workdir, "embeddings.db"),
+            "TOPIC_MODEL_DIR": os.path.join(workdir, "topic_model"),
+            "VECTOR_INDEX_DIR": os.path.join(workdir, "vector_index"),
+            "GEMINI_API_BASE": gemini_stub.api_base,
+            "GEMINI_BACKOFF_SECONDS": "0",
+            "API_KEY": "benchmark",
+            "EMBEDDING_WARMUP": "0",
+        })
+        # Imported after the environment points every path at the scratch directory.
+        import db
+        import embeddings
+        import reddit_ingest
+        import topic_modeling
+        import vector_index
+
+        if hashing_embeddings:
+            key = (embeddings.DEFAULT_MODEL_NAME, embeddings.EMBEDDING_BACKEND)
+            embeddings._models[key] = HashingEncoder()
+
+        timer = StageTimer()
+        state = {}
+
+        def ingest():
+            posts = list(synthetic_posts(size))
+            fetcher = reddit_ingest.RedditFetcher({}, client_factory=fake_reddit_factory(posts))
+            stored = topic_modeling.fetch_and_store_subreddit_posts("bench", limit=size, fetcher=fetcher)
+            return {"posts": stored}
+
+        def preprocess():
+            state["texts"], _ = topic_modeling.build_topic_texts(topic_modeling.get_posts())
+            return {"documents": len(state["texts"])}
+
+        def encode():
+            state["vectors"] = embeddings.encode(state["texts"])
+            return {"dim": int(state["vectors"].shape[1])}
+
+        def reduce():
+            state["config"] = topic_modeling.topic_model_config(len(state["texts"]))
+            state["model"] = topic_modeling.build_topic_model(state["config"], state["vectors"].shape[1])
+            state["reduced"] = state["model"].umap_model.fit_transform(state["vectors"])
+            return {"backend": state["config"]["backend"], "low_memory": state["config"]["low_memory"]}
+
+        def cluster():
+            if "reduced" not in state:
+                raise RuntimeError("skipped, the reduce stage failed")
+            state["model"].hdbscan_model.fit(state["reduced"])
+            return {"backend": state["config"]["backend"]}
+
+        def topic_modeling_full():
+            topic_modeling.refit_all_posts()
+            topics = db.get_connection().execute("SELECT COUNT(*) FROM topic_stats").fetchone()[0]
+            return {"topics": topics}
+
+        def write_back():
+            rows = db.get_connection().execute(
+                "SELECT id, topic FROM posts WHERE topic IS NOT NULL"
+            ).fetchall()
+            topic_modeling.update_topics([(row["id"], row["topic"]) for row in rows])
+            return {"posts": len(rows)}
+
+        def index_build():
+            return {"posts": vector_index.build_index()}
+
+        import app
+        client = app.app.test_client()
+        conn = db.get_connection()
+        with conn:
+            conn.execute(
+                "INSERT INTO company_details (company_name, company_profile, blogs, keywords, communities, style_guide) "
+                "VALUES ('Bench', 'Benchmark company', '', 'llm', 'bench', ?)",
+                (STYLE_GUIDE,)
+            )
+
+        def get(path):
+            response = client.get(path)
+            if response.status_code != 200:
+                raise RuntimeError(f"HTTP {response.status_code}")
+            return {"status": response.status_code, "bytes": len(response.data)}
+
+        def topic_summary():
+            top = conn.execute("SELECT name FROM topic_stats ORDER BY post_count DESC LIMIT 1").fetchone()
+            if top is None:
+                raise RuntimeError("no topics to summarize")
+            return get(f"/topic_summary/{quote(top['name'], safe='')}")
+
+        def generate_post():
+            # Once the index is built, related posts must come from it, not the full-topic fallback.
+            label = app.select_top_topic(conn)
+            if label != "general" and vector_index.get_index() is not None \
+                    and not vector_index.similar_posts(label, k=1, label=label):
+                raise RuntimeError(f"no indexed posts found for label '{label}'")
+            response = client.post("/generate_post", json={"platform": "blog"})
+            if response.status_code != 200:
+                raise RuntimeError(f"HTTP {response.status_code}: {response.get_json()}")
+            return {"status": response.status_code}
+
+        timer.run("ingest", ingest)
+        timer.run("preprocess", preprocess)
+        timer.run("encode", encode)
+        timer.run("reduce", reduce)
+        timer.run("cluster", cluster)
+        state.pop("model", None)
+        state.pop("reduced", None)
+        timer.run("topic_modeling", topic_modeling_full)
+        timer.run("write_back", write_back)
+        timer.run("vector_index", index_build)
+        timer.run("render_index", lambda: get("/"))
+        timer.run("topic_summary", topic_summary)
+        timer.run("generate_post", generate_post)
+
+    return {
+        "size": size,
+        "hashing_embeddings": hashing_embeddings,
+        "stages": timer.stages,
+        "peak_rss_bytes": peak_rss_bytes()
+    }
+
+#############################################
+# Driver
+#############################################
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="100,10000,100000", help="Comma-separated corpus sizes.")
+    parser.add_argument("--output", help="JSON file to write (default benchmarks/results/<timestamp>.json).")
+    parser.add_argument("--hashing-embeddings", action="store_true",
+                        help="Use a hashing encoder instead of the sentence-transformers model.")
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--child-output", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        # Pipeline prints go to stderr with the stage log, leaving the parent's stdout for the summary.
+        sys.stdout = sys.stderr
+        result = run_size(args.child, args.hashing_embeddings)
+        with open(args.child_output, "w") as f:
+            json.dump(result, f)
+        return
+
+    runs = []
+    for size in [int(s) for s in args.sizes.split(",") if s.strip()]:
+        print(f"Benchmarking {size} posts...")
+        with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as f:
+            child_output = f.name
+        command = [sys.executable, os.path.abspath(__file__), "--child", str(size), "--child-output", child_output]
+        if args.hashing_embeddings:
+            command.append("--hashing-embeddings")
+        completed = subprocess.run(command, cwd=ROOT)
+        try:
+            with open(child_output) as f:
+                runs.append(json.load(f))
+        except (OSError, ValueError):
+            runs.append({"size": size, "error": f"benchmark process exited with {completed.returncode}"})
+        finally:
+            os.unlink(child_output)
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "runs": runs
+    }
+    output = args.output or os.path.join(BENCH_DIR, "results", time.strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    for run in runs:
+        print(f"\n{run['size']} posts (peak RSS {(run.get('peak_rss_bytes') or 0) / 2**20:.0f} MiB)")
+        if "error" in run:
+            print("  ", run["error"])
+            continue
+        for name, stage in run["stages"].items():
+            detail = stage.get("error") or ""
+            print(f"  {name:<16} {stage['seconds']:9.3f}s  {detail}")
+    print(f"\nWrote {output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""Reproducible synthetic Reddit corpora in the shape of the posts table."""
+import random
+
+# Shared filler plus one vocabulary per theme, so clustering has structure to find.
+FILLER = (
+    "the and of to in is it this that for on with was really just like think anyone "
+    "tried still actually going new update thanks edit question help"
+).split()
+THEMES = {
+    "quantization": "quantization gguf awq int4 int8 perplexity bits weights llamacpp exllama",
+    "hardware": "gpu vram rtx 4090 3090 cuda rocm memory bandwidth nvlink",
+    "finetuning": "finetune lora qlora dataset epochs loss learning rate adapter unsloth",
+    "serving": "vllm throughput latency batch server tokens second concurrency api endpoint",
+    "agents": "agent tools function calling planner workflow orchestration browser tasks",
+    "rag": "retrieval embeddings vector database chunks rerank context documents search",
+    "benchmarks": "benchmark eval mmlu leaderboard score humaneval arena results",
+    "releases": "release weights license open model checkpoint huggingface announcement",
+    "multimodal": "vision image audio speech multimodal video captioning ocr",
+    "context": "context window long rope scaling attention sliding kv cache",
+}
+
+def synthetic_text(rng, theme_words, min_words, max_words):
+    words = []
+    for _ in range(rng.randint(min_words, max_words)):
+        words.append(rng.choice(theme_words) if rng.random() < 0.35 else rng.choice(FILLER))
+    return " ".join(words)
+
+def synthetic_posts(count, seed=0):
+    """
+    Yield count post dicts (reddit_id, subreddit, post_title, post_content, comments, score,
+    num_comments) with URLs, numbers and punctuation mixed in like real posts.
+    """
+    rng = random.Random(seed)
+    themes = [words.split() for words in THEMES.values()]
+    for i in range(count):
+        theme_words = rng.choice(themes)
+        comments = [synthetic_text(rng, theme_words, 5, 60) for _ in range(rng.randint(0, 6))]
+        content = synthetic_text(rng, theme_words, 20, 250)
+        content += f" https://example.com/post/{i}?ref=feed {rng.randint(1, 4096)}GB! (edit: thanks, 10/10)"
+        yield {
+            "reddit_id": f"bench{i}",
+            "subreddit": "bench",
+            "post_title": synthetic_text(rng, theme_words, 4, 14).capitalize(),
+            "post_content": content,
+            "comments": " ".join(comments),
+            "score": int(rng.paretovariate(1.2)) - 1,
+            "num_comments": len(comments),
+        }
+
+def synthetic_corpus(count, seed=0):
+    """Just the combined text of each synthetic post."""
+    return [
+        f"{post['post_title']} {post['post_content']} {post['comments']}"
+        for post in synthetic_posts(count, seed)
+    ]
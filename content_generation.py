@@ -0,0 +1,123 @@
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import db
+import embeddings
+import llm_client
+import scoring
+
+# Upper bound on simultaneous Gemini calls for one batch.
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+# Upper bound on topics per batch; each one costs a Gemini call per platform.
+MAX_BATCH_TOP_N = int(os.getenv("MAX_BATCH_TOP_N", "20"))
+
+PLATFORM_INSTRUCTIONS = {
+    "blog": "Generate a detailed blog post with a clear structure, engaging introduction, and call-to-action.",
+    "linkedin": "Generate a professional LinkedIn post that is concise, value-driven, and engaging for professionals.",
+    "twitter": "Generate a short and engaging tweet within 280 characters that captures attention quickly."
+}
+
+#############################################
+# Prompt Construction
+#############################################
+
+def build_post_prompt(style_guide, topic, platform):
+    return (
+        f"Using the following brand style guide:\n{style_guide}\n\n"
+        f"Topic: {topic}\n"
+        f"Platform: {platform}\n"
+        f"{PLATFORM_INSTRUCTIONS.get(platform, 'Generate a general post.')}\n\n"
+        "Response:"
+    )
+
+def top_topics(conn, top_n):
+    rows = conn.execute(
+        "SELECT name FROM topic_stats ORDER BY post_count DESC, name LIMIT ?", (top_n,)
+    ).fetchall()
+    return [row["name"] for row in rows]
+
+def topic_discussion_posts(conn, topic):
+    """Title, content and comments of every post tagged with topic."""
+    return list(db.with_comments(conn, conn.execute("""
+        SELECT p.id, p.post_title, p.post_content
+        FROM topics t
+        JOIN post_topics pt ON pt.topic_id = t.id
+        JOIN posts p ON p.id = pt.post_id
+        WHERE t.name = ?
+    """, (topic,))))
+
+#############################################
+# Batch Generation
+#############################################
+
+def generate_batch(client, style_guide, platforms, top_n=5, concurrency=BATCH_CONCURRENCY):
+    """
+    Generate one post per (topic, platform) for the top_n topics, calling Gemini concurrently
+    with at most `concurrency` requests in flight. Encodes every output in one batched
+    call for scoring, stores the results in the generations table and returns them as dicts.
+    """
+    conn = db.get_connection()
+    topics = top_topics(conn, top_n) or ["general"]
+    jobs = [
+        {"topic": topic, "platform": platform, "prompt": build_post_prompt(style_guide, topic, platform)}
+        for topic in topics
+        for platform in platforms
+    ]
+
+    def run(job):
+        try:
+            job["response"] = client.generate(job["prompt"])
+            job["error"] = None
+        except llm_client.LLMError as e:
+            print(f"Error generating {job['platform']} post for '{job['topic']}':", e)
+            job["response"] = None
+            job["error"] = str(e)
+        return job
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        results = list(pool.map(run, jobs))
+
+    succeeded = [job for job in results if job["response"] is not None]
+    if succeeded:
+        output_vectors = scoring.normalize_rows(
+            embeddings.encode([job["response"] for job in succeeded], use_cache=False)
+        )
+        style_vector = scoring.normalize_rows(embeddings.encode(style_guide))[0]
+        response_scores = output_vectors @ style_vector
+        for job, response_score in zip(succeeded, response_scores):
+            job["response_alignment_score"] = round(float(response_score) * 100, 2)
+
+        # One chunk matrix per topic, scored against all of that topic's outputs at once.
+        for topic in topics:
+            rows = [i for i, job in enumerate(succeeded) if job["topic"] == topic]
+            if not rows:
+                continue
+            chunk_vectors = scoring.discussion_chunk_vectors(topic_discussion_posts(conn, topic))
+            discussion_scores = scoring.discussion_alignment_scores(output_vectors[rows], chunk_vectors)
+            for i, discussion_score in zip(rows, discussion_scores):
+                succeeded[i]["discussion_alignment_score"] = discussion_score
+
+    batch_id = uuid.uuid4().hex
+    now = time.time()
+    with conn:
+        conn.executemany('''
+            INSERT INTO generations (batch_id, topic, platform, prompt, response,
+                                     response_alignment_score, discussion_alignment_score, error, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [
+            (batch_id, job["topic"], job["platform"], job["prompt"], job["response"],
+             job.get("response_alignment_score"), job.get("discussion_alignment_score"), job["error"], now)
+            for job in results
+        ])
+
+    return {
+        "batch_id": batch_id,
+        "generations": [
+            {key: job.get(key) for key in (
+                "topic", "platform", "response", "response_alignment_score", "discussion_alignment_score", "error"
+            )}
+            for job in results
+        ]
+    }
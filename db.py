@@ -0,0 +1,685 @@
+import contextvars
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+
+import metrics
+import sentiment
+
+DB_PATH = os.getenv("DB_PATH", "data.db")
+# Compiled statements kept per connection; the app reuses a small fixed set of queries.
+STATEMENT_CACHE_SIZE = 256
+
+# Every workspace other than the default keeps its database, topic model and vector index
+# under WORKSPACES_DIR/<name>/. The default workspace uses DB_PATH and the legacy paths.
+WORKSPACES_DIR = os.getenv("WORKSPACES_DIR", "workspaces")
+DEFAULT_WORKSPACE = "default"
+_WORKSPACE_NAME_RE = re.compile(r"^[a-z0-9][a-z0-9_-]{0,62}$")
+
+# Comment bodies at least this long are stored compressed: "zlib" (default), "zstd"
+# (needs the zstandard package) or "none".
+COMMENT_COMPRESSION = os.getenv("COMMENT_COMPRESSION", "zlib").lower()
+COMMENT_COMPRESS_MIN_BYTES = int(os.getenv("COMMENT_COMPRESS_MIN_BYTES", "256"))
+
+_workspace = contextvars.ContextVar("workspace", default=DEFAULT_WORKSPACE)
+_local = threading.local()
+_migrated_paths = set()
+_migration_lock = threading.Lock()
+
+#############################################
+# Connections
+#############################################
+
+def _operation(sql):
+    """First keyword of a statement (SELECT, INSERT, ...), to label query timings."""
+    words = sql.lstrip().split(None, 1)
+    return words[0].upper() if words else ""
+
+class InstrumentedCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        with metrics.external("sqlite", _operation(sql)):
+            return super().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        with metrics.external("sqlite", _operation(sql)):
+            return super().executemany(sql, seq_of_parameters)
+
+class InstrumentedConnection(sqlite3.Connection):
+    """
+    Records how long each statement takes to execute (the first step; rows fetched
+    afterwards are not included) in the external_call_seconds histogram.
+    """
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        with metrics.external("sqlite", _operation(sql)):
+            return super().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        with metrics.external("sqlite", _operation(sql)):
+            return super().executemany(sql, seq_of_parameters)
+
+def connect(path=None):
+    """Open a new connection in WAL mode with the pragmas the app relies on."""
+    conn = sqlite3.connect(
+        path or DB_PATH, timeout=30, cached_statements=STATEMENT_CACHE_SIZE, factory=InstrumentedConnection
+    )
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-20000")
+    return conn
+
+def get_connection(path=None):
+    """
+    Return this thread's connection to the database at path (default: the current
+    workspace's database), opening it on first use.
+    Each WSGI worker thread and background thread gets its own connection, which is
+    reused across requests so its prepared-statement cache stays warm.
+    """
+    path = path or workspace_db_path()
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+    conn = conns.get(path)
+    if conn is None:
+        init_db(path)
+        conn = conns[path] = connect(path)
+    return conn
+
+def release_connection(exception=None):
+    """End-of-request hook: roll back anything a failed request left uncommitted."""
+    for conn in getattr(_local, "conns", {}).values():
+        if conn.in_transaction:
+            conn.rollback()
+
+def close_connections():
+    """Close every connection this thread holds."""
+    for conn in getattr(_local, "conns", {}).values():
+        conn.close()
+    _local.conns = {}
+
+#############################################
+# Workspaces
+#############################################
+
+def current_workspace():
+    return _workspace.get()
+
+def set_workspace(name):
+    """Make name the current workspace; returns a token for reset_workspace()."""
+    return _workspace.set(name)
+
+def reset_workspace(token):
+    _workspace.reset(token)
+
+@contextmanager
+def use_workspace(name):
+    """Run a block against another workspace's database and files."""
+    token = set_workspace(name)
+    try:
+        yield
+    finally:
+        reset_workspace(token)
+
+def valid_workspace_name(name):
+    return bool(name) and bool(_WORKSPACE_NAME_RE.match(name))
+
+def workspace_dir(name=None):
+    """Directory holding a non-default workspace's files."""
+    return os.path.join(WORKSPACES_DIR, name or current_workspace())
+
+def workspace_db_path(name=None):
+    name = name or current_workspace()
+    if name == DEFAULT_WORKSPACE:
+        return DB_PATH
+    return os.path.join(workspace_dir(name), "data.db")
+
+def workspace_path(default_path, subdir, name=None):
+    """
+    Where a per-workspace directory (topic model, vector index) lives: default_path for
+    the default workspace, WORKSPACES_DIR/<name>/<subdir> for every other one.
+    """
+    name = name or current_workspace()
+    if name == DEFAULT_WORKSPACE:
+        return default_path
+    return os.path.join(workspace_dir(name), subdir)
+
+def workspace_exists(name):
+    return name == DEFAULT_WORKSPACE or os.path.exists(workspace_db_path(name))
+
+def create_workspace(name):
+    """Create an empty workspace (its directory and migrated database). Idempotent."""
+    if not valid_workspace_name(name):
+        raise ValueError("Workspace names are 1-63 lowercase letters, digits, '-' or '_'.")
+    if name != DEFAULT_WORKSPACE:
+        os.makedirs(workspace_dir(name), exist_ok=True)
+    init_db(workspace_db_path(name))
+
+def list_workspaces():
+    names = [DEFAULT_WORKSPACE]
+    if os.path.isdir(WORKSPACES_DIR):
+        names += sorted(
+            name for name in os.listdir(WORKSPACES_DIR)
+            if name != DEFAULT_WORKSPACE and valid_workspace_name(name) and workspace_exists(name)
+        )
+    return names
+
+#############################################
+# Schema Migration
+#############################################
+
+def _add_missing_columns(conn, table, columns):
+    existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    for name, column_type in columns:
+        if name not in existing:
+            print(f"Adding '{name}' column to {table} table.")
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {column_type}")
+
+def migrate(conn):
+    """Create or upgrade every table the app and the topic pipeline use."""
+    with conn:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS company_details (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                company_name TEXT,
+                company_profile TEXT,
+                blogs TEXT,
+                keywords TEXT,
+                communities TEXT,
+                style_guide TEXT
+            )
+        ''')
+        _add_missing_columns(conn, "company_details", [("style_guide", "TEXT")])
+
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS posts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                post_title TEXT,
+                post_content TEXT,
+                ai_response TEXT,
+                score INTEGER,
+                num_comments INTEGER,
+                topic TEXT,
+                reddit_id TEXT,
+                sentiment REAL,
+                comments_hash TEXT
+            )
+        ''')
+        _add_missing_columns(conn, "posts", [
+            ("score", "INTEGER"),
+            ("num_comments", "INTEGER"),
+            ("topic", "TEXT"),
+            ("reddit_id", "TEXT"),
+            ("sentiment", "REAL"),
+            ("comments_hash", "TEXT"),
+        ])
+        conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_posts_reddit_id ON posts(reddit_id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_posts_topic ON posts(topic)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_posts_sentiment ON posts(sentiment)")
+
+        # One row per comment; identical bodies (cross-posts, bots, quotes) are stored once
+        # in comment_bodies, compressed when large.
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS comment_bodies (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                hash BLOB NOT NULL UNIQUE,
+                codec TEXT,
+                body BLOB NOT NULL
+            )
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS comments (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                post_id INTEGER NOT NULL,
+                position INTEGER NOT NULL,
+                reddit_id TEXT,
+                score INTEGER,
+                author_hash TEXT,
+                body_id INTEGER NOT NULL
+            )
+        ''')
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_comments_post ON comments(post_id, position)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_comments_body ON comments(body_id)")
+        if "comments" in {row[1] for row in conn.execute("PRAGMA table_info(posts)")}:
+            _move_inline_comments(conn)
+
+        # One row per topic word; post_topics links posts to their (up to three) words.
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS topics (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL UNIQUE
+            )
+        ''')
+        has_post_topics = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'post_topics'"
+        ).fetchone()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS post_topics (
+                post_id INTEGER NOT NULL,
+                topic_id INTEGER NOT NULL,
+                rank INTEGER NOT NULL,
+                weight REAL,
+                PRIMARY KEY (post_id, topic_id)
+            ) WITHOUT ROWID
+        ''')
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_post_topics_topic ON post_topics(topic_id, post_id)")
+        if not has_post_topics:
+            _backfill_post_topics(conn)
+
+        # Per-topic aggregates, rebuilt whenever posts or their topics are written.
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS topic_stats (
+                topic_id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                post_count INTEGER NOT NULL,
+                total_upvotes INTEGER NOT NULL,
+                total_comments INTEGER NOT NULL,
+                avg_sentiment REAL,
+                updated_at REAL NOT NULL
+            )
+        ''')
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_topic_stats_count ON topic_stats(post_count DESC)")
+        if (conn.execute("SELECT 1 FROM topic_stats LIMIT 1").fetchone() is None
+                and conn.execute("SELECT 1 FROM post_topics LIMIT 1").fetchone() is not None):
+            # Posts from before the sentiment column need a score for the topic averages.
+            score_missing_sentiment(conn)
+            refresh_topic_stats(conn)
+
+        # Topics of the last fitted model (not the per-word topics above): keyword weights
+        # and representative posts, written by every full refit.
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS model_topics (
+                topic_num INTEGER PRIMARY KEY,
+                label TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                keywords TEXT NOT NULL,
+                representative_post_ids TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        ''')
+
+        # Background jobs (see jobs.py) and their stage-level progress.
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                params TEXT,
+                status TEXT NOT NULL,
+                stage TEXT,
+                progress REAL,
+                message TEXT,
+                result TEXT,
+                error TEXT,
+                host TEXT,
+                pid INTEGER,
+                pid_start INTEGER,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL
+            )
+        ''')
+        _add_missing_columns(conn, "jobs", [("pid_start", "INTEGER")])
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_kind_status ON jobs(kind, status)")
+
+        # Posts produced by batch generation (see content_generation.py).
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS generations (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                batch_id TEXT NOT NULL,
+                topic TEXT,
+                platform TEXT,
+                prompt TEXT,
+                response TEXT,
+                response_alignment_score REAL,
+                discussion_alignment_score REAL,
+                error TEXT,
+                created_at REAL NOT NULL
+            )
+        ''')
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_generations_batch ON generations(batch_id)")
+
+def _move_inline_comments(conn):
+    """Move the joined comments of an older posts table into the comments table, one row per post."""
+    rows = conn.execute(
+        "SELECT id, comments FROM posts WHERE comments IS NOT NULL AND comments != ''"
+    ).fetchall()
+    if rows:
+        print(f"Moving comments of {len(rows)} posts into the comments table.")
+        post_comments = [(row["id"], [{"body": row["comments"]}]) for row in rows]
+        set_post_comments(conn, post_comments)
+        conn.executemany(
+            "UPDATE posts SET comments_hash = ? WHERE id = ?",
+            [(comments_hash(comments), post_id) for post_id, comments in post_comments]
+        )
+    if sqlite3.sqlite_version_info >= (3, 35, 0):
+        conn.execute("ALTER TABLE posts DROP COLUMN comments")
+    else:
+        conn.execute("UPDATE posts SET comments = NULL")
+
+def _backfill_post_topics(conn):
+    """Populate post_topics from the comma-separated posts.topic strings of an older database."""
+    rows = conn.execute("SELECT id, topic FROM posts WHERE topic IS NOT NULL").fetchall()
+    if rows:
+        print(f"Backfilling post_topics for {len(rows)} posts.")
+        set_post_topics(conn, [(row[0], row[1]) for row in rows])
+
+#############################################
+# Topic Storage
+#############################################
+
+def split_topic_label(topic_label):
+    """'a, b, c' -> ['a', 'b', 'c']; empty labels become ['miscellaneous']."""
+    words = [t.strip() for t in (topic_label or "").split(",") if t.strip()]
+    return words or ["miscellaneous"]
+
+def set_post_topics(conn, assignments):
+    """
+    Replace the topics of many posts in the caller's transaction.
+    assignments holds (post_id, terms) pairs where terms is either a 'a, b, c' label
+    or a list of (word, weight) pairs in rank order. posts.topic is rewritten from the
+    same terms so it stays a derived, comma-separated copy for older readers.
+    """
+    normalized = []
+    for post_id, terms in assignments:
+        if isinstance(terms, str) or terms is None:
+            terms = [(word, None) for word in split_topic_label(terms)]
+        normalized.append((post_id, terms))
+    if not normalized:
+        return
+
+    names = sorted({word for _, terms in normalized for word, _ in terms})
+    conn.executemany("INSERT OR IGNORE INTO topics (name) VALUES (?)", [(name,) for name in names])
+    topic_ids = {}
+    for i in range(0, len(names), 500):
+        chunk = names[i:i + 500]
+        placeholders = ",".join("?" * len(chunk))
+        for topic_id, name in conn.execute(f"SELECT id, name FROM topics WHERE name IN ({placeholders})", chunk):
+            topic_ids[name] = topic_id
+
+    conn.executemany("DELETE FROM post_topics WHERE post_id = ?", [(post_id,) for post_id, _ in normalized])
+    conn.executemany(
+        "INSERT OR IGNORE INTO post_topics (post_id, topic_id, rank, weight) VALUES (?, ?, ?, ?)",
+        [
+            (post_id, topic_ids[word], rank, weight)
+            for post_id, terms in normalized
+            for rank, (word, weight) in enumerate(terms)
+        ]
+    )
+    conn.executemany(
+        "UPDATE posts SET topic = ? WHERE id = ?",
+        [(", ".join(word for word, _ in terms), post_id) for post_id, terms in normalized]
+    )
+
+def score_missing_sentiment(conn):
+    """
+    Score posts stored before the sentiment column existed, in the caller's transaction.
+    Returns the number of posts scored.
+    """
+    rows = conn.execute(
+        "SELECT id, post_title, post_content FROM posts WHERE sentiment IS NULL"
+    ).fetchall()
+    if not rows:
+        return 0
+    print(f"Scoring sentiment for {len(rows)} posts.")
+    scores = sentiment.score_texts([sentiment.post_text(post) for post in with_comments(conn, rows)])
+    conn.executemany(
+        "UPDATE posts SET sentiment = ? WHERE id = ?",
+        [(score, row["id"]) for row, score in zip(rows, scores)]
+    )
+    return len(rows)
+
+def refresh_topic_stats(conn):
+    """
+    Rebuild the topic_stats table (post count, upvotes, comments, average sentiment per topic)
+    in the caller's transaction, so the dashboard reads aggregates instead of every post.
+    """
+    conn.execute("DELETE FROM topic_stats")
+    conn.execute("""
+        INSERT INTO topic_stats (topic_id, name, post_count, total_upvotes, total_comments, avg_sentiment, updated_at)
+        SELECT t.id, t.name, COUNT(*), COALESCE(SUM(p.score), 0), COALESCE(SUM(p.num_comments), 0),
+               AVG(p.sentiment), ?
+        FROM post_topics pt
+        JOIN topics t ON t.id = pt.topic_id
+        JOIN posts p ON p.id = pt.post_id
+        GROUP BY t.id
+    """, (time.time(),))
+
+def set_model_topics(conn, details):
+    """
+    Replace the stored model topics in the caller's transaction. details holds
+    (topic_num, label, size, [(word, weight), ...], [representative post id, ...]) tuples.
+    """
+    now = time.time()
+    conn.execute("DELETE FROM model_topics")
+    conn.executemany(
+        "INSERT INTO model_topics (topic_num, label, size, keywords, representative_post_ids, updated_at) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        [
+            (topic_num, label, size, json.dumps(keywords), json.dumps(post_ids), now)
+            for topic_num, label, size, keywords, post_ids in details
+        ]
+    )
+
+def model_topics_for(conn, word):
+    """Stored model topics whose label contains word, largest first, with keywords and post ids decoded."""
+    rows = conn.execute("SELECT * FROM model_topics WHERE label LIKE ? ORDER BY size DESC", (f"%{word}%",))
+    topics = []
+    for row in rows:
+        if word in split_topic_label(row["label"]):
+            topic = dict(row)
+            topic["keywords"] = json.loads(topic["keywords"])
+            topic["representative_post_ids"] = json.loads(topic["representative_post_ids"])
+            topics.append(topic)
+    return topics
+
+#############################################
+# Comment Storage
+#############################################
+
+def comments_hash(comments):
+    """Digest of a post's comment bodies in order, or None without comments; detects changed threads."""
+    if not comments:
+        return None
+    digest = hashlib.blake2b(digest_size=16)
+    for comment in comments:
+        digest.update(comment["body"].encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+def _compress(body):
+    """(codec, stored value) for one comment body; short or incompressible bodies stay plain text."""
+    data = body.encode("utf-8")
+    if len(data) < COMMENT_COMPRESS_MIN_BYTES or COMMENT_COMPRESSION == "none":
+        return None, body
+    if COMMENT_COMPRESSION == "zstd":
+        try:
+            import zstandard
+            codec, packed = "zstd", zstandard.ZstdCompressor(level=9).compress(data)
+        except ImportError:
+            codec, packed = "zlib", zlib.compress(data, 6)
+    else:
+        codec, packed = "zlib", zlib.compress(data, 6)
+    return (codec, packed) if len(packed) < len(data) else (None, body)
+
+def _decompress(codec, body):
+    if codec is None:
+        return body
+    if codec == "zstd":
+        import zstandard
+        return zstandard.ZstdDecompressor().decompress(body).decode("utf-8")
+    return zlib.decompress(body).decode("utf-8")
+
+def set_post_comments(conn, post_comments):
+    """
+    Replace the comments of many posts in the caller's transaction.
+    post_comments holds (post_id, comments) pairs, each comment a dict with "body" and
+    optionally "reddit_id", "score" and "author_hash". Bodies are deduplicated by content.
+    """
+    post_comments = list(post_comments)
+    if not post_comments:
+        return
+    bodies = {}
+    for _, comments in post_comments:
+        for comment in comments:
+            bodies.setdefault(hashlib.sha256(comment["body"].encode("utf-8")).digest(), comment["body"])
+
+    # Only bodies not stored yet are compressed and written.
+    body_ids = {}
+    hashes = list(bodies)
+    for i in range(0, len(hashes), 500):
+        chunk = hashes[i:i + 500]
+        placeholders = ",".join("?" * len(chunk))
+        for body_id, body_hash in conn.execute(
+            f"SELECT id, hash FROM comment_bodies WHERE hash IN ({placeholders})", chunk
+        ):
+            body_ids[bytes(body_hash)] = body_id
+    for body_hash in hashes:
+        if body_hash not in body_ids:
+            codec, stored = _compress(bodies[body_hash])
+            body_ids[body_hash] = conn.execute(
+                "INSERT INTO comment_bodies (hash, codec, body) VALUES (?, ?, ?)", (body_hash, codec, stored)
+            ).lastrowid
+
+    conn.executemany("DELETE FROM comments WHERE post_id = ?", [(post_id,) for post_id, _ in post_comments])
+    conn.executemany(
+        "INSERT INTO comments (post_id, position, reddit_id, score, author_hash, body_id) VALUES (?, ?, ?, ?, ?, ?)",
+        [
+            (post_id, position, comment.get("reddit_id"), comment.get("score"), comment.get("author_hash"),
+             body_ids[hashlib.sha256(comment["body"].encode("utf-8")).digest()])
+            for post_id, comments in post_comments
+            for position, comment in enumerate(comments)
+        ]
+    )
+
+def delete_orphan_comment_bodies(conn):
+    """Drop bodies no comment refers to any more (after threads were replaced or posts deleted)."""
+    conn.execute("""
+        DELETE FROM comment_bodies
+        WHERE NOT EXISTS (SELECT 1 FROM comments c WHERE c.body_id = comment_bodies.id)
+    """)
+
+def iter_comment_bodies(conn, post_ids):
+    """
+    Yield (post_id, body) for every comment of post_ids, in post id then thread order.
+    Rows are read from a cursor and decompressed one at a time, so nothing holds a
+    post's whole thread unless the caller collects it.
+    """
+    post_ids = sorted(set(post_ids))
+    for i in range(0, len(post_ids), 500):
+        chunk = post_ids[i:i + 500]
+        placeholders = ",".join("?" * len(chunk))
+        for post_id, codec, body in conn.execute(f"""
+            SELECT c.post_id, b.codec, b.body
+            FROM comments c
+            JOIN comment_bodies b ON b.id = c.body_id
+            WHERE c.post_id IN ({placeholders})
+            ORDER BY c.post_id, c.position
+        """, chunk):
+            yield post_id, _decompress(codec, body)
+
+def post_comments_text(conn, post_id):
+    """One post's comment bodies joined by spaces, as the old posts.comments column held them."""
+    return " ".join(body for _, body in iter_comment_bodies(conn, [post_id]))
+
+def with_comments(conn, posts, batch_size=500):
+    """
+    Yield each post as a dict with a "comments" list of bodies, loading the comments of
+    batch_size posts per query, so a pass over the corpus never holds every thread at once.
+    """
+    posts = iter(posts)
+    while True:
+        batch = [dict(post) for post in _take(posts, batch_size)]
+        if not batch:
+            return
+        bodies = {}
+        for post_id, body in iter_comment_bodies(conn, [post["id"] for post in batch]):
+            bodies.setdefault(post_id, []).append(body)
+        for post in batch:
+            post["comments"] = bodies.get(post["id"], [])
+            yield post
+
+def _take(iterator, n):
+    for _ in range(n):
+        try:
+            yield next(iterator)
+        except StopIteration:
+            return
+
+#############################################
+# Post Listing
+#############################################
+
+# Fields a post listing may project. comments live in their own table and are the bulk
+# of a post, so they are only joined in on request.
+POST_COLUMNS = ("id", "reddit_id", "post_title", "post_content", "comments", "score",
+                "num_comments", "topic", "sentiment")
+DEFAULT_POST_COLUMNS = ("id", "post_title", "post_content", "score", "num_comments", "topic", "sentiment")
+
+def page_posts(conn, after=None, limit=50, columns=DEFAULT_POST_COLUMNS, topic=None,
+               min_sentiment=None, max_sentiment=None, descending=False):
+    """
+    One page of posts ordered by id, starting after the id `after` (keyset pagination,
+    so every page costs the same however deep it is). Returns (rows, next_cursor), where
+    next_cursor is the id to pass as `after` for the next page, or None on the last page.
+    Rows are dicts; a requested "comments" field holds the joined comment text.
+    """
+    unknown = [column for column in columns if column not in POST_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown post columns: {', '.join(unknown)}")
+    with_text = "comments" in columns
+    columns = [column for column in columns if column != "comments"]
+    columns = columns if "id" in columns else ["id", *columns]
+
+    where, params = [], []
+    if after is not None:
+        where.append("id < ?" if descending else "id > ?")
+        params.append(after)
+    if topic is not None:
+        where.append("""id IN (
+            SELECT pt.post_id FROM post_topics pt JOIN topics t ON t.id = pt.topic_id WHERE t.name = ?
+        )""")
+        params.append(topic)
+    if min_sentiment is not None:
+        where.append("sentiment >= ?")
+        params.append(min_sentiment)
+    if max_sentiment is not None:
+        where.append("sentiment <= ?")
+        params.append(max_sentiment)
+
+    sql = f"SELECT {', '.join(columns)} FROM posts"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" ORDER BY id {'DESC' if descending else 'ASC'} LIMIT ?"
+    # One extra row tells whether another page follows without a COUNT query.
+    rows = [dict(row) for row in conn.execute(sql, (*params, limit + 1)).fetchall()]
+    next_cursor = None
+    if len(rows) > limit:
+        rows, next_cursor = rows[:limit], rows[limit - 1]["id"]
+    if with_text:
+        rows = [dict(post, comments=" ".join(post["comments"])) for post in with_comments(conn, rows)]
+    return rows, next_cursor
+
+def init_db(path=None):
+    """Run the schema migration once per database file per process."""
+    path = path or workspace_db_path()
+    if path in _migrated_paths:
+        return
+    with _migration_lock:
+        if path in _migrated_paths:
+            return
+        conn = connect(path)
+        try:
+            migrate(conn)
+        finally:
+            conn.close()
+        _migrated_paths.add(path)
@@ -0,0 +1,157 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+
+import numpy as np
+
+import db
+import metrics
+
+# Stored next to data.db so the cache survives restarts and can be deleted independently.
+EMBEDDING_CACHE_PATH = os.getenv(
+    "EMBEDDING_CACHE_PATH", os.path.join(os.path.dirname(db.DB_PATH), "embeddings.db")
+)
+EMBEDDING_CACHE_MAX_MB = float(os.getenv("EMBEDDING_CACHE_MAX_MB", "512"))
+
+# SQLite limits the number of host parameters per statement.
+_LOOKUP_CHUNK = 500
+
+#############################################
+# Helper Functions
+#############################################
+
+def normalize_text(text):
+    """Unicode-normalize and collapse whitespace so trivially different copies share a key."""
+    text = unicodedata.normalize("NFC", text or "")
+    return " ".join(text.split())
+
+def content_key(text, model_name):
+    normalized = normalize_text(text)
+    return hashlib.sha256(f"{model_name}\0{normalized}".encode("utf-8")).hexdigest()
+
+#############################################
+# Content-Addressed Embedding Store
+#############################################
+
+class EmbeddingCache:
+    """
+    SQLite-backed map of (model name, normalized text) -> float32 vector.
+    Entries are evicted least-recently-used first once the store exceeds max_bytes.
+    """
+
+    def __init__(self, path=EMBEDDING_CACHE_PATH, max_bytes=int(EMBEDDING_CACHE_MAX_MB * 1024 * 1024)):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                model_name TEXT,
+                dim INTEGER,
+                vector BLOB,
+                nbytes INTEGER,
+                last_used REAL
+            )
+        ''')
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)")
+        self._conn.commit()
+
+    def get_many(self, texts, model_name):
+        """
+        Look up every text in one pass.
+        Returns a list aligned with texts holding a float32 vector or None for a miss.
+        """
+        keys = [content_key(t, model_name) for t in texts]
+        found = {}
+        now = time.time()
+        with self._lock:
+            unique_keys = list(dict.fromkeys(keys))
+            for i in range(0, len(unique_keys), _LOOKUP_CHUNK):
+                chunk = unique_keys[i:i + _LOOKUP_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+            if found:
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+                self._conn.commit()
+            results = [found.get(key) for key in keys]
+            hit_count = sum(1 for r in results if r is not None)
+            self.hits += hit_count
+            self.misses += len(results) - hit_count
+        metrics.cache_lookup("embeddings", hits=hit_count, misses=len(results) - hit_count)
+        return results
+
+    def put_many(self, texts, vectors, model_name):
+        """Insert or refresh vectors for texts, then evict down to max_bytes."""
+        now = time.time()
+        rows = []
+        for text, vector in zip(texts, vectors):
+            vector = np.asarray(vector, dtype=np.float32)
+            blob = vector.tobytes()
+            rows.append((content_key(text, model_name), model_name, vector.shape[-1], blob, len(blob), now))
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany('''
+                INSERT OR REPLACE INTO embeddings (key, model_name, dim, vector, nbytes, last_used)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', rows)
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(nbytes), 0) FROM embeddings").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes
+        freed = 0
+        stale_keys = []
+        for key, nbytes in self._conn.execute("SELECT key, nbytes FROM embeddings ORDER BY last_used ASC"):
+            stale_keys.append((key,))
+            freed += nbytes
+            if freed >= excess:
+                break
+        self._conn.executemany("DELETE FROM embeddings WHERE key = ?", stale_keys)
+        print(f"Evicted {len(stale_keys)} cached embeddings ({freed} bytes).")
+
+    def stats(self):
+        with self._lock:
+            entries, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(nbytes), 0) FROM embeddings"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "path": self.path,
+            "entries": entries,
+            "bytes": total,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None
+        }
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+def get_embedding_cache():
+    """Return the process-wide cache, opening it on first use."""
+    global _default_cache
+    if _default_cache is None:
+        with _default_cache_lock:
+            if _default_cache is None:
+                _default_cache = EmbeddingCache()
+    return _default_cache
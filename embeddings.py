@@ -0,0 +1,138 @@
+import os
+import threading
+import time
+
+import numpy as np
+
+import metrics
+from embedding_cache import get_embedding_cache
+
+DEFAULT_MODEL_NAME = "all-MiniLM-L6-v2"
+
+# "torch" (default), "onnx", or "onnx-quantized" for the int8 CPU export.
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch").lower()
+ONNX_QUANTIZED_FILE = os.getenv("EMBEDDING_ONNX_FILE", "onnx/model_qint8_avx512.onnx")
+
+_models = {}
+_model_stats = {}
+_lock = threading.Lock()
+
+#############################################
+# Helper Functions
+#############################################
+
+def _current_rss_bytes():
+    """Resident set size of this process, or None where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+def _load_model(model_name, backend):
+    # Imported on first load: torch and transformers take seconds to import.
+    from sentence_transformers import SentenceTransformer
+    if backend == "onnx":
+        return SentenceTransformer(model_name, backend="onnx")
+    if backend == "onnx-quantized":
+        return SentenceTransformer(
+            model_name,
+            backend="onnx",
+            model_kwargs={"file_name": ONNX_QUANTIZED_FILE}
+        )
+    return SentenceTransformer(model_name)
+
+#############################################
+# Shared Model Registry
+#############################################
+
+def get_sentence_model(model_name=DEFAULT_MODEL_NAME, backend=None):
+    """
+    Return the process-wide SentenceTransformer for model_name, loading it on first use.
+    Safe to call from multiple threads; each (model, backend) pair is loaded exactly once.
+    """
+    backend = (backend or EMBEDDING_BACKEND).lower()
+    key = (model_name, backend)
+    model = _models.get(key)
+    if model is not None:
+        return model
+
+    with _lock:
+        model = _models.get(key)
+        if model is not None:
+            return model
+
+        rss_before = _current_rss_bytes()
+        start = time.perf_counter()
+        try:
+            model = _load_model(model_name, backend)
+        except Exception as e:
+            if backend == "torch":
+                raise
+            print(f"Could not load {model_name} with backend '{backend}', falling back to torch: {e}")
+            backend = "torch"
+            model = _load_model(model_name, backend)
+        load_seconds = time.perf_counter() - start
+        rss_after = _current_rss_bytes()
+
+        _models[key] = model
+        _model_stats[key] = {
+            "model_name": model_name,
+            "backend": backend,
+            "load_seconds": round(load_seconds, 3),
+            "rss_delta_bytes": (rss_after - rss_before) if rss_before is not None and rss_after is not None else None,
+            "loaded_at": time.time()
+        }
+        print(f"Loaded embedding model {model_name} ({backend}) in {load_seconds:.2f}s")
+        return model
+
+def encode(texts, model_name=DEFAULT_MODEL_NAME, use_cache=True, show_progress_bar=False):
+    """
+    Encode a string or list of strings as float32 vectors.
+    Texts already in the embedding cache are not re-encoded; only misses reach the model.
+    """
+    single = isinstance(texts, str)
+    if single:
+        texts = [texts]
+    texts = list(texts)
+
+    if not use_cache:
+        model = get_sentence_model(model_name)
+        with metrics.external("embedding_model", "encode"):
+            vectors = model.encode(texts, show_progress_bar=show_progress_bar)
+        vectors = np.asarray(vectors, dtype=np.float32)
+        return vectors[0] if single else vectors
+
+    cache = get_embedding_cache()
+    cached = cache.get_many(texts, model_name)
+    missing = [i for i, vector in enumerate(cached) if vector is None]
+    if missing:
+        missing_texts = [texts[i] for i in missing]
+        model = get_sentence_model(model_name)
+        with metrics.external("embedding_model", "encode"):
+            new_vectors = np.asarray(
+                model.encode(missing_texts, show_progress_bar=show_progress_bar), dtype=np.float32
+            )
+        cache.put_many(missing_texts, new_vectors, model_name)
+        for i, vector in zip(missing, new_vectors):
+            cached[i] = vector
+        print(f"Encoded {len(missing)} new texts ({len(texts) - len(missing)} from cache).")
+
+    vectors = np.vstack(cached) if cached else np.empty((0, 0), dtype=np.float32)
+    return vectors[0] if single else vectors
+
+def warm_up(model_name=DEFAULT_MODEL_NAME):
+    """Load the model and run one encode so the first request does not pay for it."""
+    model = get_sentence_model(model_name)
+    model.encode("warm up", show_progress_bar=False)
+    return model
+
+def model_stats():
+    """Load-time and memory figures for every model loaded in this process."""
+    stats = [dict(s) for s in _model_stats.values()]
+    return {
+        "models": stats,
+        "process_rss_bytes": _current_rss_bytes(),
+        "embedding_cache": get_embedding_cache().stats()
+    }
@@ -0,0 +1,168 @@
+import json
+import os
+import socket
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import db
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "1"))
+
+_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="job")
+# Jobs of the same kind in the same workspace never run side by side in this process;
+# different workspaces (brands) run concurrently when JOB_WORKERS > 1.
+_kind_locks = {}
+_kind_locks_guard = threading.Lock()
+
+#############################################
+# Helper Functions
+#############################################
+
+def _kind_lock(workspace, kind):
+    with _kind_locks_guard:
+        return _kind_locks.setdefault((workspace, kind), threading.Lock())
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        return True
+    return True
+
+def _process_start(pid):
+    """
+    When process pid started, in clock ticks since boot (Linux), or None where that is unknown.
+    Recorded with a job's pid, since containers hand the same low pids out on every restart.
+    """
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # Fields follow the parenthesised command name, which may itself contain spaces.
+            return int(f.read().rsplit(")", 1)[1].split()[19])
+    except (OSError, IndexError, ValueError):
+        return None
+
+def _process_alive(pid, pid_start):
+    """Whether the process that recorded (pid, pid_start) is still running."""
+    if not _pid_alive(pid):
+        return False
+    return pid_start is None or _process_start(pid) in (None, pid_start)
+
+def _update(job_id, **fields):
+    conn = db.get_connection()
+    assignments = ", ".join(f"{name} = ?" for name in fields)
+    with conn:
+        conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+def job_to_dict(row):
+    job = dict(row)
+    job["params"] = json.loads(job["params"]) if job["params"] else {}
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    return job
+
+#############################################
+# Job Queue
+#############################################
+
+def enqueue(kind, fn, params=None):
+    """
+    Record a job in the current workspace and run fn(progress, **params) on the background
+    pool, inside that workspace.
+    If a job of the same kind is already queued or running there (in any process sharing
+    the database), that job is returned instead of starting a second one.
+    Returns (job dict, created).
+    """
+    params = params or {}
+    conn = db.get_connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        active = conn.execute(
+            "SELECT * FROM jobs WHERE kind = ? AND status IN ('queued', 'running') ORDER BY created_at LIMIT 1",
+            (kind,)
+        ).fetchone()
+        if active is not None:
+            conn.commit()
+            return job_to_dict(active), False
+        job_id = uuid.uuid4().hex
+        conn.execute('''
+            INSERT INTO jobs (id, kind, params, status, progress, created_at, host, pid, pid_start)
+            VALUES (?, ?, ?, 'queued', 0, ?, ?, ?, ?)
+        ''', (job_id, kind, json.dumps(params), time.time(), socket.gethostname(), os.getpid(),
+              _process_start(os.getpid())))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    _executor.submit(_run, db.current_workspace(), job_id, kind, fn, params)
+    return get_job(job_id), True
+
+def _run(workspace, job_id, kind, fn, params):
+    with db.use_workspace(workspace):
+        _run_in_workspace(workspace, job_id, kind, fn, params)
+
+def _run_in_workspace(workspace, job_id, kind, fn, params):
+    def progress(stage, fraction=None, message=None):
+        fields = {"stage": stage}
+        if fraction is not None:
+            fields["progress"] = round(max(0.0, min(1.0, fraction)), 4)
+        if message is not None:
+            fields["message"] = message
+        _update(job_id, **fields)
+
+    with _kind_lock(workspace, kind):
+        _update(job_id, status="running", started_at=time.time())
+        try:
+            result = fn(progress, **params)
+        except Exception as e:
+            traceback.print_exc()
+            _update(job_id, status="failed", error=str(e), finished_at=time.time())
+        else:
+            _update(
+                job_id,
+                status="succeeded",
+                progress=1.0,
+                result=json.dumps(result) if result is not None else None,
+                finished_at=time.time()
+            )
+
+def get_job(job_id):
+    row = db.get_connection().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    return job_to_dict(row) if row else None
+
+def list_jobs(limit=20):
+    rows = db.get_connection().execute(
+        "SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)
+    ).fetchall()
+    return [job_to_dict(row) for row in rows]
+
+def recover_interrupted_jobs():
+    """
+    In every workspace, mark jobs left queued/running by a dead process on this host as failed.
+    Called once at startup, before this process has run any job.
+    """
+    for workspace in db.list_workspaces():
+        with db.use_workspace(workspace):
+            _recover_workspace_jobs()
+
+def _recover_workspace_jobs():
+    conn = db.get_connection()
+    rows = conn.execute(
+        "SELECT id, pid, pid_start FROM jobs WHERE status IN ('queued', 'running') AND host = ?",
+        (socket.gethostname(),)
+    ).fetchall()
+    stale = [
+        (time.time(), row["id"]) for row in rows
+        # Our own pid can only belong to an earlier process, as nothing has run here yet.
+        if row["pid"] == os.getpid() or not _process_alive(row["pid"], row["pid_start"])
+    ]
+    if stale:
+        with conn:
+            conn.executemany(
+                "UPDATE jobs SET status = 'failed', error = 'interrupted', finished_at = ? WHERE id = ?", stale
+            )
+        print(f"Marked {len(stale)} interrupted jobs as failed.")
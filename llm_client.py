@@ -0,0 +1,210 @@
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+GEMINI_API_BASE = os.getenv("GEMINI_API_BASE", "https://generativelanguage.googleapis.com/v1beta")
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "60"))
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "3"))
+GEMINI_BACKOFF_SECONDS = float(os.getenv("GEMINI_BACKOFF_SECONDS", "1.0"))
+GEMINI_CACHE_TTL = float(os.getenv("GEMINI_CACHE_TTL", "3600"))
+GEMINI_CACHE_SIZE = int(os.getenv("GEMINI_CACHE_SIZE", "256"))
+
+_RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    """The model could not produce a response; never shown to users as if it were content."""
+
+
+#############################################
+# Gemini Client
+#############################################
+
+class GeminiClient:
+    """
+    Gemini generateContent client with a pooled keep-alive session, retries with jittered
+    backoff on 429/5xx, coalescing of identical in-flight prompts and a TTL response cache.
+    """
+
+    def __init__(self, api_key, model=GEMINI_MODEL, api_base=GEMINI_API_BASE,
+                 cache_ttl=GEMINI_CACHE_TTL, cache_size=GEMINI_CACHE_SIZE):
+        self.api_key = api_key
+        self.model = model
+        self.api_base = api_base.rstrip("/")
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"Content-Type": "application/json"})
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._in_flight = {}
+        self._in_flight_lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.coalesced = 0
+
+    def _cache_key(self, prompt_text):
+        return (self.model, hashlib.sha256(prompt_text.encode("utf-8")).hexdigest())
+
+    def _cache_get(self, key):
+        with self._cache_lock:
+            entry = self._cache.get(key)
+            if entry is None or entry[0] < time.time():
+                self._cache.pop(key, None)
+                self.cache_misses += 1
+                metrics.cache_lookup("gemini", misses=1)
+                return None
+            self._cache.move_to_end(key)
+            self.cache_hits += 1
+            metrics.cache_lookup("gemini", hits=1)
+            return entry[1]
+
+    def _cache_put(self, key, text):
+        with self._cache_lock:
+            self._cache[key] = (time.time() + self.cache_ttl, text)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _post(self, method, payload, stream=False):
+        """POST to models/<model>:<method>, retrying transient failures. Returns the response."""
+        url = f"{self.api_base}/models/{self.model}:{method}"
+        params = {"alt": "sse"} if stream else None
+        for attempt in range(GEMINI_MAX_RETRIES + 1):
+            retry_after = None
+            try:
+                # For streams this times the wait for response headers, not the whole stream.
+                with metrics.external("gemini", method):
+                    response = self.session.post(
+                        url,
+                        params=params,
+                        json=payload,
+                        headers={"x-goog-api-key": self.api_key or ""},
+                        timeout=GEMINI_TIMEOUT,
+                        stream=stream
+                    )
+                if response.status_code not in _RETRYABLE_STATUS:
+                    response.raise_for_status()
+                    return response
+                metrics.EXTERNAL_ERRORS.inc(service="gemini", operation=method)
+                error = f"HTTP {response.status_code}"
+                retry_after = response.headers.get("Retry-After")
+                response.close()
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = str(e)
+            except requests.HTTPError as e:
+                metrics.EXTERNAL_ERRORS.inc(service="gemini", operation=method)
+                raise LLMError(f"Gemini request failed: {e}") from e
+
+            if attempt == GEMINI_MAX_RETRIES:
+                raise LLMError(f"Gemini request failed after {attempt + 1} attempts: {error}")
+            delay = GEMINI_BACKOFF_SECONDS * (2 ** attempt) * (0.5 + random.random())
+            if retry_after and retry_after.isdigit():
+                delay = max(delay, float(retry_after))
+            print(f"Gemini request failed ({error}), retrying in {delay:.1f}s.")
+            metrics.EXTERNAL_RETRIES.inc(service="gemini")
+            time.sleep(delay)
+
+    def _generate_uncached(self, prompt_text):
+        response = self._post("generateContent", {"contents": [{"parts": [{"text": prompt_text}]}]})
+        try:
+            result = response.json()
+            candidates = result.get("candidates", [])
+            if not candidates:
+                raise LLMError("No response generated.")
+            return candidates[0]["content"]["parts"][0]["text"]
+        except (ValueError, KeyError, IndexError, TypeError) as e:
+            raise LLMError(f"Unexpected Gemini response: {e}") from e
+
+    def generate(self, prompt_text, use_cache=False):
+        """
+        Return the model's text for prompt_text, raising LLMError on failure.
+        Concurrent calls with the same prompt share one request. With use_cache=True a
+        response younger than the cache TTL is returned without calling the API.
+        """
+        key = self._cache_key(prompt_text)
+        if use_cache:
+            cached = self._cache_get(key)
+            if cached is not None:
+                return cached
+
+        with self._in_flight_lock:
+            call = self._in_flight.get(key)
+            leader = call is None
+            if leader:
+                call = {"done": threading.Event(), "result": None, "error": None}
+                self._in_flight[key] = call
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call["done"].wait()
+            if call["error"] is not None:
+                raise call["error"]
+            return call["result"]
+
+        try:
+            call["result"] = self._generate_uncached(prompt_text)
+            self._cache_put(key, call["result"])
+            return call["result"]
+        except LLMError as e:
+            call["error"] = e
+            raise
+        except Exception as e:
+            call["error"] = LLMError(str(e))
+            raise call["error"] from e
+        finally:
+            with self._in_flight_lock:
+                self._in_flight.pop(key, None)
+            call["done"].set()
+
+    def stream_generate(self, prompt_text):
+        """
+        Yield the response text chunk by chunk from streamGenerateContent (server-sent events).
+        Only the initial request is retried; a failure mid-stream raises LLMError.
+        """
+        response = self._post(
+            "streamGenerateContent", {"contents": [{"parts": [{"text": prompt_text}]}]}, stream=True
+        )
+        response.encoding = "utf-8"
+        produced = False
+        try:
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                chunk = json.loads(line[len("data:"):].strip())
+                for candidate in chunk.get("candidates", [])[:1]:
+                    for part in candidate.get("content", {}).get("parts", []):
+                        if part.get("text"):
+                            produced = True
+                            yield part["text"]
+        except (ValueError, requests.RequestException) as e:
+            raise LLMError(f"Gemini stream failed: {e}") from e
+        finally:
+            response.close()
+        if not produced:
+            raise LLMError("No response generated.")
+
+    def stats(self):
+        lookups = self.cache_hits + self.cache_misses
+        return {
+            "model": self.model,
+            "cache_entries": len(self._cache),
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "cache_hit_rate": round(self.cache_hits / lookups, 4) if lookups else None,
+            "coalesced_requests": self.coalesced
+        }
@@ -0,0 +1,207 @@
+import io
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Print one line per finished span (stage or external call) when set to 1.
+METRICS_LOG_SPANS = os.getenv("METRICS_LOG_SPANS", "0") == "1"
+# Allow ?_profile=1 on any route to return a profile of that request instead of its response.
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "0") == "1"
+# Seconds between stack samples for the sampling profiler (pyinstrument, when installed).
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.001"))
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+#############################################
+# Metric Types
+#############################################
+
+def _label_key(labelnames, labels):
+    return tuple(str(labels.get(name, "")) for name in labelnames)
+
+def _format_labels(labelnames, key, extra=None):
+    pairs = list(zip(labelnames, key)) + list(extra or [])
+    if not pairs:
+        return ""
+    escaped = [
+        (name, value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+        for name, value in pairs
+    ]
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(_label_key(self.labelnames, labels), 0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {value}"
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # key -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[i] += 1
+            entry[len(self.buckets)] += 1
+            entry[-1] += value
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(entry)) for key, entry in self._values.items()]
+        for key, entry in items:
+            for bound, count in zip(self.buckets, entry):
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', repr(float(bound)))])} {count}"
+            yield f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', '+Inf')])} {entry[len(self.buckets)]}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {entry[len(self.buckets)]}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {entry[-1]}"
+
+def _register(metric):
+    with _registry_lock:
+        return _registry.setdefault(metric.name, metric)
+
+def counter(name, help, labelnames=()):
+    """The process-wide counter called name, created on first use."""
+    return _register(Counter(name, help, labelnames))
+
+def histogram(name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+    """The process-wide histogram called name, created on first use."""
+    return _register(Histogram(name, help, labelnames, buckets))
+
+#############################################
+# Shared Metrics
+#############################################
+
+STAGE_SECONDS = histogram("pipeline_stage_seconds", "Duration of topic pipeline stages.", ["stage"])
+EXTERNAL_SECONDS = histogram(
+    "external_call_seconds", "Duration of calls to Reddit, Gemini, the embedding model and SQLite.",
+    ["service", "operation"]
+)
+EXTERNAL_ERRORS = counter("external_call_errors_total", "Failed external calls.", ["service", "operation"])
+EXTERNAL_RETRIES = counter("external_call_retries_total", "Retried external calls.", ["service"])
+CACHE_REQUESTS = counter("cache_requests_total", "Cache lookups by cache and result (hit or miss).", ["cache", "result"])
+HTTP_SECONDS = histogram("http_request_seconds", "Route latency until the response is returned.",
+                         ["method", "route", "status"])
+
+#############################################
+# Spans
+#############################################
+
+@contextmanager
+def _span(histogram, errors, log_name, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        if errors is not None:
+            errors.inc(**labels)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        histogram.observe(elapsed, **labels)
+        if METRICS_LOG_SPANS:
+            fields = " ".join(f"{name}={value}" for name, value in labels.items())
+            print(f"[span] {log_name} {fields} seconds={elapsed:.4f}")
+
+def stage(name):
+    """Time a topic pipeline stage: `with metrics.stage("fetch"): ...`."""
+    return _span(STAGE_SECONDS, None, "stage", stage=name)
+
+def external(service, operation):
+    """Time one call to an external service, counting it as an error if it raises."""
+    return _span(EXTERNAL_SECONDS, EXTERNAL_ERRORS, "external", service=service, operation=operation)
+
+def cache_lookup(cache, hits=0, misses=0):
+    if hits:
+        CACHE_REQUESTS.inc(hits, cache=cache, result="hit")
+    if misses:
+        CACHE_REQUESTS.inc(misses, cache=cache, result="miss")
+
+#############################################
+# Exposition
+#############################################
+
+def render():
+    """Every registered metric in the Prometheus text exposition format."""
+    with _registry_lock:
+        metrics = list(_registry.values())
+    lines = []
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.samples())
+    return "\n".join(lines) + "\n"
+
+#############################################
+# Request Profiling
+#############################################
+
+class RequestProfiler:
+    """
+    Profiles one request: pyinstrument's sampling profiler when it is installed,
+    cProfile otherwise. report() returns (mimetype, body).
+    """
+
+    def __init__(self):
+        try:
+            from pyinstrument import Profiler
+            self._profiler = Profiler(interval=PROFILE_INTERVAL)
+            self.sampling = True
+        except ImportError:
+            import cProfile
+            self._profiler = cProfile.Profile()
+            self.sampling = False
+
+    def start(self):
+        if self.sampling:
+            self._profiler.start()
+        else:
+            self._profiler.enable()
+
+    def stop(self):
+        if self.sampling:
+            self._profiler.stop()
+        else:
+            self._profiler.disable()
+
+    def report(self):
+        if self.sampling:
+            return "text/html", self._profiler.output_html()
+        import pstats
+        out = io.StringIO()
+        pstats.Stats(self._profiler, stream=out).sort_stats("cumulative").print_stats(60)
+        return "text/plain", out.getvalue()
@@ -0,0 +1,109 @@
+import itertools
+import multiprocessing
+import os
+import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+# Inputs at least this large are preprocessed on a process pool.
+PREPROCESS_PARALLEL_MIN = int(os.getenv("PREPROCESS_PARALLEL_MIN", "5000"))
+PREPROCESS_PROCESSES = int(os.getenv("PREPROCESS_PROCESSES", str(os.cpu_count() or 1)))
+# Workers start from a fresh interpreter rather than a fork: the app process runs threads
+# (job pool, scheduler), and a forked child could inherit locks they were holding.
+_MP_CONTEXT = multiprocessing.get_context(
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+
+# URLs, punctuation and digits are all deleted, so one pass handles them together.
+# URLs come first in the alternation so they are removed whole before their punctuation is.
+_STRIP_RE = re.compile(r"https?://\S+|www\.\S+|[^\w\s]+|\d+")
+
+# NLTK's English stopword list, vendored so no corpus download is needed (air-gapped hosts).
+ENGLISH_STOP_WORDS = frozenset({
+    "i", "me", "my", "myself", "we", "our", "ours", "ourselves", "you", "you're", "you've",
+    "you'll", "you'd", "your", "yours", "yourself", "yourselves", "he", "him", "his", "himself",
+    "she", "she's", "her", "hers", "herself", "it", "it's", "its", "itself", "they", "them",
+    "their", "theirs", "themselves", "what", "which", "who", "whom", "this", "that", "that'll",
+    "these", "those", "am", "is", "are", "was", "were", "be", "been", "being", "have", "has",
+    "had", "having", "do", "does", "did", "doing", "a", "an", "the", "and", "but", "if", "or",
+    "because", "as", "until", "while", "of", "at", "by", "for", "with", "about", "against",
+    "between", "into", "through", "during", "before", "after", "above", "below", "to", "from",
+    "up", "down", "in", "out", "on", "off", "over", "under", "again", "further", "then", "once",
+    "here", "there", "when", "where", "why", "how", "all", "any", "both", "each", "few", "more",
+    "most", "other", "some", "such", "no", "nor", "not", "only", "own", "same", "so", "than",
+    "too", "very", "s", "t", "can", "will", "just", "don", "don't", "should", "should've",
+    "now", "d", "ll", "m", "o", "re", "ve", "y", "ain", "aren", "aren't", "couldn", "couldn't",
+    "didn", "didn't", "doesn", "doesn't", "hadn", "hadn't", "hasn", "hasn't", "haven",
+    "haven't", "isn", "isn't", "ma", "mightn", "mightn't", "mustn", "mustn't", "needn",
+    "needn't", "shan", "shan't", "shouldn", "shouldn't", "wasn", "wasn't", "weren", "weren't",
+    "won", "won't", "wouldn", "wouldn't"
+})
+
+CUSTOM_STOP_WORDS = frozenset({
+    "im", "ive", "dont", "cant", "you", "me", "now", "like",
+    "the", "open", "local", "translate", "tool", "llms",
+    "would", "inference", "think", "implementation", "explores",
+    "nice", "integrations", "flux", "get", "got", "using", "use",
+    "make", "just", "know", "way", "something", "used", "need",
+    "could", "want", "trying", "even", "gonna", "say", "look",
+    "every", "much", "working", "500", "time", "day", "really",
+    "see", "stuff", "anyone", "tried", "first", "still", "actually",
+    "going", "new", "one", "two", "sure", "bit", "of"
+})
+
+STOP_WORDS = ENGLISH_STOP_WORDS | CUSTOM_STOP_WORDS
+
+#############################################
+# Stop Words
+#############################################
+
+def get_stop_words():
+    """NLTK English stopwords plus the custom list of Reddit filler words."""
+    return STOP_WORDS
+
+#############################################
+# Preprocessing
+#############################################
+
+def preprocess_text(text, stop_words=None):
+    """
+    Lowercase, drop URLs, punctuation and digits, and keep words longer than two
+    characters that are not stop words.
+    """
+    if not text:
+        return ""
+    stop_words = get_stop_words() if stop_words is None else stop_words
+    words = _STRIP_RE.sub("", text.lower()).split()
+    return " ".join([w for w in words if len(w) > 2 and w not in stop_words])
+
+def _preprocess_chunk(texts):
+    stop_words = get_stop_words()
+    return [preprocess_text(text, stop_words) for text in texts]
+
+def preprocess_many(texts, processes=None):
+    """
+    preprocess_text for every text, in order, as a list.
+    Large inputs are split across a process pool; small ones are processed in-process.
+    texts may be a generator; it is consumed a chunk at a time, so the raw texts are
+    never all held at once.
+    """
+    texts = iter(texts)
+    processes = processes or PREPROCESS_PROCESSES
+    head = list(itertools.islice(texts, PREPROCESS_PARALLEL_MIN))
+    if len(head) < PREPROCESS_PARALLEL_MIN or processes <= 1:
+        return _preprocess_chunk(itertools.chain(head, texts))
+
+    chunk_size = -(-PREPROCESS_PARALLEL_MIN // (processes * 4))
+    texts = itertools.chain(head, texts)
+    del head
+    results = []
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=processes, mp_context=_MP_CONTEXT) as pool:
+        while chunk := list(itertools.islice(texts, chunk_size)):
+            pending.append(pool.submit(_preprocess_chunk, chunk))
+            # A few chunks per worker in flight keeps the pool busy without reading ahead.
+            if len(pending) >= processes * 2:
+                results.extend(pending.popleft().result())
+        while pending:
+            results.extend(pending.popleft().result())
+    return results
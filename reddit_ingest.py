@@ -0,0 +1,246 @@
+import hashlib
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import prawcore
+from dotenv import load_dotenv
+
+import metrics
+
+# Comment pages are fetched in parallel on this many threads.
+REDDIT_MAX_WORKERS = int(os.getenv("REDDIT_MAX_WORKERS", "8"))
+REDDIT_MAX_RETRIES = int(os.getenv("REDDIT_MAX_RETRIES", "4"))
+REDDIT_BACKOFF_SECONDS = float(os.getenv("REDDIT_BACKOFF_SECONDS", "1.0"))
+# Requests held back from the advertised quota so in-flight workers do not overshoot it.
+REDDIT_RATE_LIMIT_RESERVE = int(os.getenv("REDDIT_RATE_LIMIT_RESERVE", str(REDDIT_MAX_WORKERS)))
+
+# What a refresh did with each post in a hot listing: fetched its comments, updated only
+# its score and comment count, or skipped it as unchanged.
+LISTED_POSTS = metrics.counter("reddit_listed_posts_total", "Hot-listing posts by refresh action.", ["action"])
+
+_RETRYABLE_ERRORS = (
+    prawcore.exceptions.TooManyRequests,
+    prawcore.exceptions.ServerError,
+    prawcore.exceptions.RequestException,
+)
+
+#############################################
+# Client Construction
+#############################################
+
+def author_hash(author):
+    """Stable pseudonym for a comment author (None for deleted accounts); usernames are not stored."""
+    if author is None:
+        return None
+    return hashlib.blake2b(str(author).encode("utf-8"), digest_size=8).hexdigest()
+
+def parse_communities(communities):
+    """Accept 'a, b' or ['a', 'b'] and return a clean list of subreddit names."""
+    if isinstance(communities, str):
+        communities = communities.split(",")
+    names = [name.strip().removeprefix("r/") for name in communities or []]
+    return [name for name in names if name]
+
+def reddit_settings():
+    """
+    Credentials and endpoints for praw.Reddit, read from the environment.
+    REDDIT_OAUTH_URL and REDDIT_URL point the client at a local fake Reddit server for testing.
+    Returns None if credentials are missing.
+    """
+    load_dotenv()
+    settings = {
+        "client_id": os.getenv("REDDIT_CLIENT_ID"),
+        "client_secret": os.getenv("REDDIT_CLIENT_SECRET"),
+        "user_agent": os.getenv("REDDIT_USER_AGENT"),
+    }
+    if not all(settings.values()):
+        return None
+    if os.getenv("REDDIT_OAUTH_URL"):
+        settings["oauth_url"] = os.getenv("REDDIT_OAUTH_URL")
+    if os.getenv("REDDIT_URL"):
+        settings["reddit_url"] = os.getenv("REDDIT_URL")
+    return settings
+
+def create_reddit_client(settings):
+    import praw
+    return praw.Reddit(requestor_kwargs={'timeout': 60}, **settings)
+
+#############################################
+# Rate-Limit-Aware Scheduler
+#############################################
+
+class RateLimitScheduler:
+    """
+    Shares Reddit's rate-limit budget between worker threads.
+    Every worker calls acquire() before a request and observe() with its client's
+    auth.limits afterwards; once the remaining budget reaches the reserve, acquire()
+    blocks until the window resets.
+    """
+
+    def __init__(self, reserve=REDDIT_RATE_LIMIT_RESERVE):
+        self.reserve = reserve
+        self.remaining = None
+        self.reset_timestamp = None
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                if self.remaining is None or self.remaining > self.reserve:
+                    if self.remaining is not None:
+                        self.remaining -= 1
+                    return
+                wait = (self.reset_timestamp or time.time()) - time.time()
+                if wait <= 0:
+                    self.remaining = None
+                    continue
+            print(f"Reddit rate limit nearly used up, waiting {wait:.1f}s for the window to reset.")
+            time.sleep(min(wait, 60))
+
+    def observe(self, limits):
+        """Fold the X-Ratelimit-* values a client last saw into the shared budget."""
+        remaining = limits.get("remaining")
+        reset_timestamp = limits.get("reset_timestamp")
+        if remaining is None:
+            return
+        with self._lock:
+            if self.remaining is None or remaining < self.remaining:
+                self.remaining = remaining
+            if reset_timestamp is not None:
+                self.reset_timestamp = max(self.reset_timestamp or 0, reset_timestamp)
+
+    def call(self, reddit, fn, operation="request"):
+        """Run fn() under the rate limit, retrying transient failures with jittered backoff."""
+        for attempt in range(REDDIT_MAX_RETRIES + 1):
+            self.acquire()
+            try:
+                with metrics.external("reddit", operation):
+                    return fn()
+            except _RETRYABLE_ERRORS as e:
+                if attempt == REDDIT_MAX_RETRIES:
+                    raise
+                delay = REDDIT_BACKOFF_SECONDS * (2 ** attempt) * (0.5 + random.random())
+                print(f"Reddit request failed ({e}), retrying in {delay:.1f}s.")
+                metrics.EXTERNAL_RETRIES.inc(service="reddit")
+                time.sleep(delay)
+            finally:
+                self.observe(reddit.auth.limits)
+
+#############################################
+# Concurrent Fetching
+#############################################
+
+class RedditFetcher:
+    """
+    Fetches hot posts and their top-level comments from several subreddits at once.
+    PRAW is not thread-safe, so each worker thread gets its own client.
+    """
+
+    def __init__(self, settings, max_workers=REDDIT_MAX_WORKERS, client_factory=create_reddit_client):
+        self.settings = settings
+        self.max_workers = max_workers
+        self.client_factory = client_factory
+        self.scheduler = RateLimitScheduler()
+        self._local = threading.local()
+
+    def _client(self):
+        if not hasattr(self._local, "reddit"):
+            self._local.reddit = self.client_factory(self.settings)
+        return self._local.reddit
+
+    def _list_hot(self, subreddit_name, limit):
+        reddit = self._client()
+        submissions = self.scheduler.call(
+            reddit, lambda: list(reddit.subreddit(subreddit_name).hot(limit=limit)), "hot"
+        )
+        return [
+            {
+                "reddit_id": post.id,
+                "subreddit": subreddit_name,
+                "post_title": post.title,
+                "post_content": post.selftext if post.selftext else post.title,
+                "score": post.score,
+                "num_comments": post.num_comments,
+            }
+            for post in submissions
+        ]
+
+    def _fetch_comments(self, reddit_id):
+        reddit = self._client()
+
+        def load():
+            submission = reddit.submission(id=reddit_id)
+            submission.comments.replace_more(limit=0)
+            return [
+                {
+                    "reddit_id": getattr(comment, "id", None),
+                    "body": comment.body,
+                    "score": getattr(comment, "score", None),
+                    "author_hash": author_hash(getattr(comment, "author", None)),
+                }
+                for comment in submission.comments if hasattr(comment, "body")
+            ]
+
+        return self.scheduler.call(reddit, load, "comments")
+
+    def iter_posts(self, subreddit_names, limit, known=None):
+        """
+        Yield one post dict per hot post of every subreddit, with its top-level comments as a
+        list of dicts (reddit_id, body, score, author_hash), as soon as they arrive.
+
+        known maps reddit_id to the stored (score, num_comments). Posts found there with both
+        unchanged are skipped; posts whose score alone moved are yielded with comments=None
+        and their comments are not fetched again.
+
+        When a comment fetch fails, the stored thread is left alone: a known post is yielded
+        with comments=None and its stored num_comments, a new one with no comments and
+        num_comments=None. Either way the next poll sees a changed count and retries.
+        """
+        known = known or {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            listing_futures = {
+                pool.submit(self._list_hot, name, limit): name for name in subreddit_names
+            }
+            comment_futures = {}
+            for future in as_completed(listing_futures):
+                name = listing_futures[future]
+                try:
+                    posts = future.result()
+                except Exception as e:
+                    print(f"Error fetching posts from r/{name}:", e)
+                    continue
+                fetch = []
+                for post in posts:
+                    stored = known.get(post["reddit_id"])
+                    if stored is None or stored[1] != post["num_comments"]:
+                        fetch.append(post)
+                    elif stored[0] != post["score"]:
+                        LISTED_POSTS.inc(action="counts_only")
+                        post["comments"] = None
+                        yield post
+                    else:
+                        LISTED_POSTS.inc(action="unchanged")
+                print(f"Fetched {len(posts)} posts from r/{name}, loading comments for {len(fetch)}...")
+                for post in fetch:
+                    comment_futures[pool.submit(self._fetch_comments, post["reddit_id"])] = post
+
+            for future in as_completed(comment_futures):
+                # Drop finished entries so fetched comments are not held until the run ends.
+                post = comment_futures.pop(future)
+                try:
+                    post["comments"] = future.result()
+                except Exception as e:
+                    print(f"Error fetching comments for post {post['reddit_id']}: {e}")
+                    LISTED_POSTS.inc(action="failed")
+                    stored = known.get(post["reddit_id"])
+                    if stored is None:
+                        post["comments"], post["num_comments"] = [], None
+                    else:
+                        post["comments"], post["num_comments"] = None, stored[1]
+                    yield post
+                    continue
+                LISTED_POSTS.inc(action="fetched")
+                yield post
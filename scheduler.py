@@ -0,0 +1,85 @@
+import os
+import threading
+import time
+
+import db
+import jobs
+import reddit_ingest
+import topic_modeling
+
+# Minutes between automatic incremental refreshes of every workspace; 0 (default) disables them.
+REFRESH_INTERVAL_MINUTES = float(os.getenv("REFRESH_INTERVAL_MINUTES", "0"))
+# Hot posts polled per subreddit on each refresh.
+REFRESH_LIMIT = int(os.getenv("REFRESH_LIMIT", "50"))
+
+_started = False
+_start_lock = threading.Lock()
+
+#############################################
+# Refresh Jobs
+#############################################
+
+def company_subreddits(conn):
+    """The subreddits listed in the last-saved company details, or None without company details."""
+    company = conn.execute("SELECT communities FROM company_details ORDER BY id DESC LIMIT 1").fetchone()
+    if not company:
+        return None
+    # Assume the user typed something like "LocalLLaMA" or "AskReddit" in the communities field.
+    return reddit_ingest.parse_communities(company["communities"] or "LocalLLaMA") or ["LocalLLaMA"]
+
+def enqueue_refresh(limit=REFRESH_LIMIT, incremental=True):
+    """
+    Queue run_topic_modeling on the current workspace's communities as a background job.
+    Returns (job dict, created), or (None, False) when the workspace has no company details.
+    """
+    subreddits = company_subreddits(db.get_connection())
+    if subreddits is None:
+        return None, False
+    return jobs.enqueue(
+        "topic_modeling",
+        lambda progress, **params: topic_modeling.run_topic_modeling(progress=progress, **params),
+        {"subreddit_name": ",".join(subreddits), "limit": limit, "incremental": incremental}
+    )
+
+def refresh_due(interval_seconds):
+    """Whether the current workspace's last topic-modeling job was queued at least interval_seconds ago."""
+    row = db.get_connection().execute(
+        "SELECT MAX(created_at) FROM jobs WHERE kind = 'topic_modeling'"
+    ).fetchone()
+    return row[0] is None or time.time() - row[0] >= interval_seconds
+
+#############################################
+# Scheduler Loop
+#############################################
+
+def refresh_all_workspaces(interval_seconds):
+    """Queue an incremental refresh in every workspace that has not had one for interval_seconds."""
+    for workspace in db.list_workspaces():
+        with db.use_workspace(workspace):
+            try:
+                if refresh_due(interval_seconds):
+                    job, created = enqueue_refresh()
+                    if created:
+                        print(f"Queued scheduled refresh {job['id']} for workspace '{workspace}'.")
+            except Exception as e:
+                print(f"Could not schedule a refresh for workspace '{workspace}':", e)
+
+def _loop(interval_seconds):
+    # Jobs queued by any process count towards the interval, so several app processes
+    # sharing the databases do not each refresh on their own schedule.
+    while True:
+        refresh_all_workspaces(interval_seconds)
+        time.sleep(min(interval_seconds, 60))
+
+def start(interval_minutes=REFRESH_INTERVAL_MINUTES):
+    """Start the background refresh loop once per process; does nothing when the interval is 0."""
+    global _started
+    if interval_minutes <= 0:
+        return False
+    with _start_lock:
+        if _started:
+            return False
+        _started = True
+    threading.Thread(target=_loop, args=(interval_minutes * 60,), name="refresh-scheduler", daemon=True).start()
+    print(f"Refreshing every workspace every {interval_minutes:g} minutes.")
+    return True
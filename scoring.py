@@ -0,0 +1,80 @@
+import os
+
+import numpy as np
+
+import embeddings
+
+# all-MiniLM-L6-v2 truncates at 256 word pieces; 128 words stays safely under that.
+CHUNK_WORDS = int(os.getenv("DISCUSSION_CHUNK_WORDS", "128"))
+# Bounds tokenization cost per post; the first chunks carry the title, body and top comments.
+MAX_CHUNKS_PER_POST = int(os.getenv("DISCUSSION_MAX_CHUNKS_PER_POST", "4"))
+# "max", "mean" or "topk" (mean of the TOP_K most similar chunks).
+DISCUSSION_AGGREGATION = os.getenv("DISCUSSION_SCORE_AGGREGATION", "topk").lower()
+TOP_K = int(os.getenv("DISCUSSION_SCORE_TOP_K", "5"))
+
+#############################################
+# Chunking
+#############################################
+
+def chunk_text(text, max_words=CHUNK_WORDS):
+    words = (text or "").split()
+    return [" ".join(words[i:i + max_words]) for i in range(0, len(words), max_words)]
+
+def post_chunks(post, max_chunks=MAX_CHUNKS_PER_POST):
+    """
+    Chunks of one post: title and content first, then its comments (a list of bodies).
+    Comment bodies are only consumed until max_chunks is filled.
+    """
+    head = f"{post['post_title'] or ''} {post['post_content'] or ''}"
+    chunks = chunk_text(head)[:max_chunks]
+    words = []
+    for body in post["comments"] or ():
+        if len(words) >= (max_chunks - len(chunks)) * CHUNK_WORDS:
+            break
+        words.extend(body.split())
+    chunks += [" ".join(words[i:i + CHUNK_WORDS]) for i in range(0, len(words), CHUNK_WORDS)]
+    return chunks[:max_chunks]
+
+def discussion_chunk_vectors(posts):
+    """
+    Embedding matrix (n_chunks, dim) over every chunk of every post.
+    Chunks go through the embedding cache, so unchanged posts are not re-encoded.
+    """
+    chunks = [chunk for post in posts for chunk in post_chunks(post)]
+    if not chunks:
+        return None
+    return embeddings.encode(chunks)
+
+#############################################
+# Similarity
+#############################################
+
+def normalize_rows(matrix):
+    matrix = np.atleast_2d(np.asarray(matrix, dtype=np.float32))
+    return matrix / np.clip(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12, None)
+
+def aggregate_similarities(similarities, aggregation=None, k=TOP_K):
+    """Reduce an (n_outputs, n_chunks) similarity matrix to one value per output."""
+    aggregation = aggregation or DISCUSSION_AGGREGATION
+    if aggregation == "max":
+        return similarities.max(axis=1)
+    if aggregation == "mean":
+        return similarities.mean(axis=1)
+    if aggregation == "topk":
+        k = max(1, min(k, similarities.shape[1]))
+        top = np.partition(similarities, -k, axis=1)[:, -k:]
+        return top.mean(axis=1)
+    raise ValueError(f"Unknown aggregation: {aggregation}")
+
+def discussion_alignment_scores(output_vectors, chunk_vectors, aggregation=None, k=TOP_K):
+    """
+    Percent alignment of each output with a discussion (a list of floats rounded to two
+    places), from one matrix product of normalized output vectors against normalized
+    chunk vectors.
+    """
+    outputs = normalize_rows(output_vectors)
+    if chunk_vectors is None or len(chunk_vectors) == 0:
+        return [0.0] * len(outputs)
+    similarities = outputs @ normalize_rows(chunk_vectors).T
+    # Rounded as Python floats; rounding in float32 would leave values like 24.799999237.
+    return [round(float(score) * 100, 2) for score in aggregate_similarities(similarities, aggregation, k)]
@@ -0,0 +1,79 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+# "textblob" (default, matches the dashboard's historical numbers) or "vader" (NLTK lexicon, faster).
+SENTIMENT_BACKEND = os.getenv("SENTIMENT_BACKEND", "textblob").lower()
+# Batches at least this large are scored on a process pool.
+SENTIMENT_PARALLEL_MIN = int(os.getenv("SENTIMENT_PARALLEL_MIN", "500"))
+SENTIMENT_PROCESSES = int(os.getenv("SENTIMENT_PROCESSES", str(os.cpu_count() or 1)))
+# Never fork the threaded app process; see preprocessing._MP_CONTEXT.
+_MP_CONTEXT = multiprocessing.get_context(
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+
+#############################################
+# Scoring Backends
+#############################################
+
+def _textblob_scorer():
+    from textblob import TextBlob
+    return lambda text: TextBlob(text).sentiment.polarity
+
+def _vader_scorer():
+    import nltk
+    from nltk.sentiment import SentimentIntensityAnalyzer
+    try:
+        analyzer = SentimentIntensityAnalyzer()
+    except LookupError:
+        nltk.download('vader_lexicon', quiet=True)
+        analyzer = SentimentIntensityAnalyzer()
+    return lambda text: analyzer.polarity_scores(text)["compound"]
+
+# Each entry builds a text -> polarity in [-1, 1] function; add more with register_backend().
+BACKENDS = {
+    "textblob": _textblob_scorer,
+    "vader": _vader_scorer,
+}
+
+_scorers = {}
+
+def register_backend(name, factory):
+    BACKENDS[name] = factory
+
+def get_scorer(backend=None):
+    backend = backend or SENTIMENT_BACKEND
+    if backend not in _scorers:
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown sentiment backend: {backend}")
+        _scorers[backend] = BACKENDS[backend]()
+    return _scorers[backend]
+
+#############################################
+# Batch Scoring
+#############################################
+
+def _score_chunk(backend, texts):
+    scorer = get_scorer(backend)
+    return [scorer(text) if text else 0.0 for text in texts]
+
+def score_texts(texts, backend=None, processes=None):
+    """
+    Polarity for every text, in order.
+    Large batches are split across a process pool; small ones are scored in-process.
+    """
+    backend = backend or SENTIMENT_BACKEND
+    texts = list(texts)
+    processes = processes or SENTIMENT_PROCESSES
+    if len(texts) < SENTIMENT_PARALLEL_MIN or processes <= 1:
+        return _score_chunk(backend, texts)
+
+    chunk_size = -(-len(texts) // (processes * 4))
+    chunks = [texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)]
+    with ProcessPoolExecutor(max_workers=processes, mp_context=_MP_CONTEXT) as pool:
+        results = pool.map(_score_chunk, [backend] * len(chunks), chunks)
+        return [score for chunk_scores in results for score in chunk_scores]
+
+def post_text(post):
+    """The text a post's sentiment is measured on: title, content and comments (a list of bodies)."""
+    return f"{post['post_title'] or ''} {post['post_content'] or ''} {' '.join(post['comments'] or ())}"
@@ -1,242 +1,463 @@
-from bertopic import BERTopic
-from sentence_transformers import SentenceTransformer
-from umap import UMAP
-from hdbscan import HDBSCAN
-import sqlite3
-import praw
 from tqdm import tqdm
-import nltk
-import re
-from textblob import TextBlob
 import os
-from dotenv import load_dotenv
-
-# Download NLTK stopwords if not already downloaded
-nltk.download('stopwords')
-from nltk.corpus import stopwords
+import json
+import time
+from collections import Counter
+
+import db
+import embeddings
+import metrics
+import preprocessing
+import reddit_ingest
+import sentiment
+import vector_index
+
+# Fitted BERTopic model is kept here between runs so new posts can be assigned without a refit.
+TOPIC_MODEL_DIR = os.getenv("TOPIC_MODEL_DIR", "topic_model")
+# Refit from scratch once new posts exceed this fraction of the corpus the model was fitted on...
+REFIT_NEW_DOC_RATIO = float(os.getenv("TOPIC_REFIT_NEW_DOC_RATIO", "0.5"))
+# ...or once this fraction of the new posts land in the outlier topic (-1).
+REFIT_OUTLIER_RATIO = float(os.getenv("TOPIC_REFIT_OUTLIER_RATIO", "0.6"))
+# "auto" (default), "umap-hdbscan" or "pca-kmeans"; auto switches to PCA + MiniBatchKMeans
+# from TOPIC_LARGE_CORPUS_DOCS posts, where UMAP and HDBSCAN get slow and memory hungry.
+TOPIC_BACKEND = os.getenv("TOPIC_BACKEND", "auto").lower()
+TOPIC_LARGE_CORPUS_DOCS = int(os.getenv("TOPIC_LARGE_CORPUS_DOCS", "20000"))
+# "auto" (on from TOPIC_LOW_MEMORY_DOCS posts), "1" or "0". Low-memory mode skips the
+# posts x topics probability matrix and uses the memory-saving UMAP/BERTopic/PCA variants.
+TOPIC_LOW_MEMORY = os.getenv("TOPIC_LOW_MEMORY", "auto").lower()
+TOPIC_LOW_MEMORY_DOCS = int(os.getenv("TOPIC_LOW_MEMORY_DOCS", "5000"))
+# Cores for UMAP and HDBSCAN in low-memory runs (-1 = all). Smaller runs stay single-threaded
+# so UMAP's random_state, and therefore the labels, are reproducible.
+TOPIC_N_JOBS = int(os.getenv("TOPIC_N_JOBS", "-1"))
+TOPIC_PCA_COMPONENTS = int(os.getenv("TOPIC_PCA_COMPONENTS", "50"))
+TOPIC_MAX_CLUSTERS = int(os.getenv("TOPIC_MAX_CLUSTERS", "200"))
+# Keep every model topic's keyword weights and representative posts for the summary pages.
+TOPIC_SAVE_DETAILS = os.getenv("TOPIC_SAVE_DETAILS", "1") == "1"
+# Rows per executemany call when streaming fetched posts into the database.
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "200"))
+
+# Comments are stored separately (db.set_post_comments); comments_hash stands in for them
+# when deciding whether a post's text changed.
+UPSERT_POST_SQL = """
+    INSERT INTO posts (reddit_id, post_title, post_content, comments_hash, ai_response, score, num_comments, sentiment)
+    VALUES (:reddit_id, :post_title, :post_content, :comments_hash, :ai_response, :score, :num_comments, :sentiment)
+    ON CONFLICT(reddit_id) DO UPDATE SET
+        topic = CASE
+            WHEN posts.post_title IS NOT excluded.post_title
+              OR posts.post_content IS NOT excluded.post_content
+              OR posts.comments_hash IS NOT excluded.comments_hash
+            THEN NULL ELSE posts.topic END,
+        post_title = excluded.post_title,
+        post_content = excluded.post_content,
+        comments_hash = excluded.comments_hash,
+        score = excluded.score,
+        num_comments = excluded.num_comments,
+        sentiment = excluded.sentiment
+"""
+
+# A post stored before reddit_id existed takes the id of the fetched post with the same text,
+# so the upsert below updates it instead of adding a duplicate.
+ADOPT_LEGACY_POST_SQL = """
+    UPDATE posts SET reddit_id = :reddit_id
+    WHERE id = (
+        SELECT id FROM posts
+        WHERE reddit_id IS NULL AND post_title IS :post_title AND post_content IS :post_content
+        LIMIT 1
+    ) AND NOT EXISTS (SELECT 1 FROM posts WHERE reddit_id = :reddit_id)
+"""
+
+# Posts whose comment count has not moved keep their stored comments and sentiment.
+UPDATE_POST_COUNTS_SQL = "UPDATE posts SET score = :score, num_comments = :num_comments WHERE reddit_id = :reddit_id"
 
 #############################################
 # Helper Functions
 #############################################
 
-def remove_stop_words(text, stop_words):
-    # Lowercase, split text, and filter out stop words.
-    words = text.lower().split()
-    filtered_words = [w for w in words if w not in stop_words]
-    return " ".join(filtered_words)
-
-def preprocess_text(text, stop_words):
-    if not text:
-        return ""
-    text = text.lower()
-    # Remove URLs
-    text = re.sub(r'https?://\S+|www\.\S+', '', text)
-    # Remove special characters and numbers
-    text = re.sub(r'[^\w\s]', '', text)
-    text = re.sub(r'\d+', '', text)
-    # Remove extra whitespace
-    text = re.sub(r'\s+', ' ', text).strip()
-    # Split and filter stop words (only keep words longer than 2 characters)
-    words = text.split()
-    filtered = [w for w in words if w not in stop_words and len(w) > 2]
-    return " ".join(filtered)
+def batched(iterable, size):
+    """Yield lists of up to `size` items without materializing the whole iterable."""
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
 
 #############################################
 # Database Schema Functions
 #############################################
 
-def ensure_posts_table_columns():
-    """
-    Ensure the posts table has the following columns:
-      - comments
-      - score
-      - num_comments
-      - topic
-    """
-    conn = sqlite3.connect('data.db')
-    cur = conn.cursor()
-    cur.execute("PRAGMA table_info(posts)")
-    columns = [row[1] for row in cur.fetchall()]
-    if "comments" not in columns:
-        print("Adding 'comments' column to posts table.")
-        cur.execute("ALTER TABLE posts ADD COLUMN comments TEXT")
-        conn.commit()
-    if "score" not in columns:
-        print("Adding 'score' column to posts table.")
-        cur.execute("ALTER TABLE posts ADD COLUMN score INTEGER")
-        conn.commit()
-    if "num_comments" not in columns:
-        print("Adding 'num_comments' column to posts table.")
-        cur.execute("ALTER TABLE posts ADD COLUMN num_comments INTEGER")
-        conn.commit()
-    if "topic" not in columns:
-        print("Adding 'topic' column to posts table.")
-        cur.execute("ALTER TABLE posts ADD COLUMN topic TEXT")
-        conn.commit()
-    conn.close()
-
-def clear_posts_table():
-    conn = sqlite3.connect('data.db')
+def clear_posts_table(conn):
+    """Delete every post, its comments and topics in the caller's transaction."""
     cur = conn.cursor()
+    cur.execute("DELETE FROM post_topics")
+    cur.execute("DELETE FROM topic_stats")
+    cur.execute("DELETE FROM comments")
+    cur.execute("DELETE FROM comment_bodies")
     cur.execute("DELETE FROM posts")
     cur.execute("DELETE FROM sqlite_sequence WHERE name='posts'")
-    conn.commit()
-    conn.close()
     print("Cleared old posts and reset auto-increment.")
 
 #############################################
 # Fetching Posts from Reddit
 #############################################
 
-def fetch_and_store_subreddit_posts(subreddit_name="LocalLLaMA", limit=50):
-    """Fetches posts from a given subreddit and stores them in the 'posts' table."""
-
-    load_dotenv()
+def no_progress(stage, fraction=None, message=None):
+    pass
 
-    # Get credentials from environment variables
-    client_id = os.getenv("REDDIT_CLIENT_ID")
-    client_secret = os.getenv("REDDIT_CLIENT_SECRET")
-    user_agent = os.getenv("REDDIT_USER_AGENT")
+def previous_comment_hashes(conn, reddit_ids):
+    """reddit_id -> stored comments_hash for the posts among reddit_ids that are already stored."""
+    if not reddit_ids:
+        return {}
+    placeholders = ",".join("?" * len(reddit_ids))
+    return dict(conn.execute(
+        f"SELECT reddit_id, comments_hash FROM posts WHERE reddit_id IN ({placeholders})", reddit_ids
+    ).fetchall())
 
-    # Check if the environment variables were loaded
-    if not all([client_id, client_secret, user_agent]):
-        print("Error: Reddit API credentials not found in .env file or environment variables.")
-        print("Please ensure REDDIT_CLIENT_ID, REDDIT_CLIENT_SECRET, and REDDIT_USER_AGENT are set.")
-        return # Or raise an exception
-
-    reddit = praw.Reddit(
-        client_id=client_id,
-        client_secret=client_secret,
-        user_agent=user_agent,
-        requestor_kwargs={'timeout': 60}
-    )
-    subreddit = reddit.subreddit(subreddit_name)
-    posts_data = []
-    print(f"Fetching posts from r/{subreddit_name}...")
-    try:
-        for post in tqdm(subreddit.hot(limit=limit)):
-            content = post.selftext if post.selftext else post.title
-            # Fetch top-level comments:
-            try:
-                post.comments.replace_more(limit=0)
-                comments = " ".join([comment.body for comment in post.comments if hasattr(comment, "body")])
-            except Exception as e:
-                print(f"Error fetching comments for post {post.id}: {e}")
-                comments = ""
-            posts_data.append({
-                "post_title": post.title,
-                "post_content": content,
-                "comments": comments,
-                "ai_response": "",  # Initially empty
-                "score": post.score,
-                "num_comments": post.num_comments
-            })
-    except Exception as e:
-        print("Error fetching posts from Reddit:", e)
-        return
-
-    conn = sqlite3.connect('data.db')
-    cur = conn.cursor()
-    # Create the posts table with all required columns if it doesn't exist.
-    cur.execute('''
-        CREATE TABLE IF NOT EXISTS posts (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            post_title TEXT,
-            post_content TEXT,
-            comments TEXT,
-            ai_response TEXT,
-            score INTEGER,
-            num_comments INTEGER,
-            topic TEXT
-        )
-    ''')
-    for post_item in posts_data: # Changed 'post' to 'post_item' to avoid conflict with tqdm 'post'
-        # Update the INSERT statement if you added new column
-        cur.execute("""
-            INSERT INTO posts (post_title, post_content, comments, ai_response, score, num_comments)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, (post_item["post_title"], post_item["post_content"], post_item["comments"],
-              post_item["ai_response"], post_item["score"], post_item["num_comments"]))
-    conn.commit()
-    conn.close()
-    print(f"Stored {len(posts_data)} posts from r/{subreddit_name} into the database.")
+def store_comment_threads(conn, posts, previous_hashes):
+    """
+    Write the comments of just-upserted posts whose thread differs from the one stored
+    before (previous_hashes, from previous_comment_hashes). Returns the threads rewritten.
+    """
+    changed = [post for post in posts if previous_hashes.get(post["reddit_id"]) != post["comments_hash"]]
+    if not changed:
+        return 0
+    placeholders = ",".join("?" * len(changed))
+    ids = dict(conn.execute(
+        f"SELECT reddit_id, id FROM posts WHERE reddit_id IN ({placeholders})",
+        [post["reddit_id"] for post in changed]
+    ).fetchall())
+    db.set_post_comments(conn, [(ids[post["reddit_id"]], post["comments"]) for post in changed])
+    return len(changed)
+
+def stored_post_counts(conn):
+    """reddit_id -> (score, num_comments) for every stored post, for change detection."""
+    rows = conn.execute("SELECT reddit_id, score, num_comments FROM posts WHERE reddit_id IS NOT NULL")
+    return {row["reddit_id"]: (row["score"], row["num_comments"]) for row in rows}
+
+def fetch_and_store_subreddit_posts(subreddit_name="LocalLLaMA", limit=50, progress=no_progress, fetcher=None,
+                                    skip_unchanged=False, replace=False):
+    """
+    Fetches hot posts from one or more subreddits and stores them in the 'posts' table.
+    subreddit_name may be a single name, a comma-separated string, or a list of names;
+    `limit` applies per subreddit. Comment pages are fetched concurrently.
+    With skip_unchanged=True, stored posts whose score and comment count have not moved are
+    skipped, and comments are fetched again only for posts whose comment count changed.
+    With replace=True, the stored posts are deleted in the same transaction once the first
+    batch has arrived, so a failed or empty fetch leaves them in place.
+    progress(stage, fraction, message) is called after every stored batch.
+    fetcher replaces the RedditFetcher built from the environment (the benchmarks pass
+    one with an offline client). Returns the number of posts stored or updated.
+    """
+    if fetcher is None:
+        settings = reddit_ingest.reddit_settings()
+
+        # Check if the environment variables were loaded
+        if settings is None:
+            print("Error: Reddit API credentials not found in .env file or environment variables.")
+            print("Please ensure REDDIT_CLIENT_ID, REDDIT_CLIENT_SECRET, and REDDIT_USER_AGENT are set.")
+            return 0 # Or raise an exception
+        fetcher = reddit_ingest.RedditFetcher(settings)
+
+    subreddit_names = reddit_ingest.parse_communities(subreddit_name)
+    print(f"Fetching posts from {', '.join('r/' + name for name in subreddit_names)}...")
+
+    conn = db.get_connection()
+    known = stored_post_counts(conn) if skip_unchanged else None
+    adopt_legacy = not replace and has_legacy_posts()
+
+    def fetched_posts():
+        for post in tqdm(fetcher.iter_posts(subreddit_names, limit, known), total=limit * len(subreddit_names)):
+            post["ai_response"] = ""  # Initially empty
+            yield post
+
+    stored = 0
+    threads_written = 0
+    # Posts stream straight from the fetcher into executemany batches inside one
+    # transaction, so memory stays flat and there is a single commit for the run.
+    # Upsert by Reddit id so history is kept across runs. A post whose text changed
+    # gets its topic cleared so the next topic modeling pass reassigns it.
+    with conn:
+        for batch in batched(fetched_posts(), INGEST_BATCH_SIZE):
+            if replace and not stored:
+                clear_posts_table(conn)
+            full = [post for post in batch if post["comments"] is not None]
+            # Sentiment is scored once per post here, a batch at a time, and stored with it.
+            texts = [sentiment.post_text(dict(p, comments=[c["body"] for c in p["comments"]])) for p in full]
+            for post, polarity in zip(full, sentiment.score_texts(texts)):
+                post["sentiment"] = polarity
+                post["comments_hash"] = db.comments_hash(post["comments"])
+            if adopt_legacy:
+                conn.executemany(ADOPT_LEGACY_POST_SQL, full)
+            previous_hashes = previous_comment_hashes(conn, [post["reddit_id"] for post in full])
+            conn.executemany(UPSERT_POST_SQL, full)
+            threads_written += store_comment_threads(conn, full, previous_hashes)
+            conn.executemany(UPDATE_POST_COUNTS_SQL, [post for post in batch if post["comments"] is None])
+            stored += len(batch)
+            progress("fetch", stored / (limit * len(subreddit_names)), f"Stored {stored} posts")
+        if threads_written:
+            db.delete_orphan_comment_bodies(conn)
+        # Scores and comment counts of already-labelled posts may have moved.
+        db.refresh_topic_stats(conn)
+    print(f"Stored {stored} new or changed posts from {', '.join('r/' + name for name in subreddit_names)}.")
+    return stored
 
 #############################################
 # Database Retrieval and Update Functions
 #############################################
 
-def get_posts():
-    """Retrieve all posts from the 'posts' table."""
-    conn = sqlite3.connect('data.db')
-    conn.row_factory = sqlite3.Row
+def get_posts(only_unassigned=False):
+    """
+    Retrieve posts from the 'posts' table.
+    With only_unassigned=True, return just the posts that have no topic yet (new or changed).
+    Comments are not included; db.with_comments streams them in where needed.
+    """
+    conn = db.get_connection()
     cur = conn.cursor()
-    posts = cur.execute("""
-        SELECT id, post_title, post_content, comments, ai_response, score, num_comments, topic
+    query = """
+        SELECT id, post_title, post_content, ai_response, score, num_comments, topic, sentiment
         FROM posts
-    """).fetchall()
-    conn.close()
+    """
+    if only_unassigned:
+        query += " WHERE topic IS NULL"
+    posts = cur.execute(query).fetchall()
     return posts
 
-def update_topic(post_id, topic_label):
-    """Update the 'topic' column for a specific post."""
-    conn = sqlite3.connect('data.db')
-    cur = conn.cursor()
-    cur.execute("UPDATE posts SET topic = ? WHERE id = ?", (topic_label, post_id))
-    conn.commit()
-    conn.close()
+def has_unassigned_posts():
+    """Whether any post is new or has changed text and so still needs a topic."""
+    return db.get_connection().execute("SELECT 1 FROM posts WHERE topic IS NULL LIMIT 1").fetchone() is not None
+
+def has_legacy_posts():
+    """Whether any post predates Reddit ids, so the upsert must first match it to a fetched post by text."""
+    return db.get_connection().execute("SELECT 1 FROM posts WHERE reddit_id IS NULL LIMIT 1").fetchone() is not None
+
+def update_topics(assignments):
+    """
+    Write many (post_id, topic) pairs in one transaction, where topic is a 'a, b, c' label
+    or a list of (word, weight) pairs. Fills post_topics and the derived posts.topic column.
+    """
+    conn = db.get_connection()
+    with conn:
+        db.set_post_topics(conn, assignments)
+        db.refresh_topic_stats(conn)
+
+def score_missing_sentiment():
+    """Score posts stored before the sentiment column existed and refresh the topic averages."""
+    conn = db.get_connection()
+    with conn:
+        if db.score_missing_sentiment(conn):
+            db.refresh_topic_stats(conn)
 
 #############################################
 # Topic Modeling and Metrics Aggregation
 #############################################
 
-def perform_topic_modeling_on_posts(posts):
+def build_topic_texts(posts):
     """
-    Perform topic modeling on the combined text (title, content, comments) of each post.
-    Returns the trained BERTopic model, the list of topic IDs, and the list of post IDs.
+    Combine title, content, and comments for each post and preprocess the result.
+    Comments are streamed from the comments table a batch of posts at a time, so only the
+    preprocessed texts are held for the whole corpus.
+    Returns the list of texts and the matching list of post IDs.
     """
-    # Get NLTK stopwords and add a custom list.
-    stop_words = set(stopwords.words('english'))
-    custom_stop = {
-        "im", "ive", "dont", "cant", "you", "me", "now", "like",
-        "the", "open", "local", "translate", "tool", "llms",
-        "would", "inference", "think", "implementation", "explores",
-        "nice", "integrations", "flux", "get", "got", "using", "use",
-        "make", "just", "know", "way", "something", "used", "need",
-        "could", "want", "trying", "even", "gonna", "say", "look",
-        "every", "much", "working", "500", "time", "day", "really",
-        "see", "stuff", "anyone", "tried", "first", "still", "actually",
-        "going", "new", "one", "two", "sure", "bit", "of"
-    }
-    stop_words = stop_words.union(custom_stop)
-
+    combined_texts = (
+        f"{post['post_title']} {post['post_content']} {' '.join(post['comments'])}"
+        for post in db.with_comments(db.get_connection(), posts)
+    )
     texts = []
     post_ids = []
-    # Combine title, content, and comments for each post.
-    for post in posts:
-        combined_text = f"{post['post_title']} {post['post_content']} {post['comments']}"
-        processed_text = preprocess_text(combined_text, stop_words)
-        if processed_text and len(processed_text.split()) >= 3:   # posts with less than 3 words after preprocessing removed
+    for post, processed_text in zip(posts, preprocessing.preprocess_many(combined_texts)):
+        if processed_text.count(" ") >= 2:   # posts with less than 3 words after preprocessing removed
             texts.append(processed_text)
             post_ids.append(post["id"])
+    return texts, post_ids
 
-    if not texts:
-        return None, None, None
-
-    sentence_model = SentenceTransformer("all-MiniLM-L6-v2")
-    embeddings = sentence_model.encode(texts, show_progress_bar=True)
-    umap_model = UMAP(n_components=5, random_state=42)
-    hdbscan_model = HDBSCAN(min_cluster_size=3, min_samples=1, prediction_data=True)
-    topic_model = BERTopic(
-        umap_model=umap_model,
-        hdbscan_model=hdbscan_model,
-        nr_topics="auto",
+def topic_model_config(n_docs):
+    """
+    Backend, memory mode and cluster sizes for a fit over n_docs posts.
+    Cluster sizes grow with the square root of the corpus; at 50 posts they match the
+    original min_cluster_size=3, min_samples=1.
+    """
+    backend = TOPIC_BACKEND
+    if backend == "auto":
+        backend = "pca-kmeans" if n_docs >= TOPIC_LARGE_CORPUS_DOCS else "umap-hdbscan"
+    if backend not in ("umap-hdbscan", "pca-kmeans"):
+        raise ValueError(f"Unknown topic backend: {backend}")
+    if TOPIC_LOW_MEMORY == "auto":
+        low_memory = n_docs >= TOPIC_LOW_MEMORY_DOCS
+    else:
+        low_memory = TOPIC_LOW_MEMORY in ("1", "true", "yes")
+    min_cluster_size = max(3, int(n_docs ** 0.5 / 2))
+    return {
+        "n_docs": n_docs,
+        "backend": backend,
+        "low_memory": low_memory,
+        "n_jobs": TOPIC_N_JOBS if low_memory else 1,
+        "min_cluster_size": min_cluster_size,
+        "min_samples": max(1, min_cluster_size // 3),
+        "n_clusters": max(2, min(TOPIC_MAX_CLUSTERS, int((n_docs / 2) ** 0.5), n_docs))
+    }
+
+def build_topic_model(config, dim):
+    """An unfitted BERTopic wired with the reduction and clustering models config asks for."""
+    # Imported here so the web app starts without loading the topic-modeling stack.
+    from bertopic import BERTopic
+
+    if config["backend"] == "pca-kmeans":
+        from sklearn.cluster import MiniBatchKMeans
+        from sklearn.decomposition import PCA, IncrementalPCA
+        n_components = min(TOPIC_PCA_COMPONENTS, dim, config["n_docs"])
+        if config["low_memory"]:
+            reduction_model = IncrementalPCA(n_components=n_components)
+        else:
+            reduction_model = PCA(n_components=n_components, random_state=42)
+        cluster_model = MiniBatchKMeans(n_clusters=config["n_clusters"], batch_size=4096, n_init=3, random_state=42)
+        nr_topics = None
+    else:
+        from hdbscan import HDBSCAN
+        from umap import UMAP
+        if config["low_memory"]:
+            reduction_model = UMAP(n_components=5, low_memory=True, n_jobs=config["n_jobs"])
+        else:
+            reduction_model = UMAP(n_components=5, random_state=42)
+        cluster_model = HDBSCAN(
+            min_cluster_size=config["min_cluster_size"],
+            min_samples=config["min_samples"],
+            prediction_data=True,
+            core_dist_n_jobs=config["n_jobs"]
+        )
+        nr_topics = "auto"
+
+    return BERTopic(
+        umap_model=reduction_model,
+        hdbscan_model=cluster_model,
+        nr_topics=nr_topics,
         top_n_words=10,
-        calculate_probabilities=True,
+        calculate_probabilities=not config["low_memory"],
+        low_memory=config["low_memory"],
         verbose=True
     )
-    topics, _ = topic_model.fit_transform(texts, embeddings)
-    topic_model.update_topics(texts, topics, top_n_words=5)
-    return topic_model, topics, post_ids
+
+def perform_topic_modeling_on_posts(posts):
+    """
+    Perform topic modeling on the combined text (title, content, comments) of each post.
+    Returns the trained BERTopic model, the list of topic IDs, the list of post IDs and
+    the preprocessed texts they were fitted on.
+    """
+    with metrics.stage("preprocess"):
+        texts, post_ids = build_topic_texts(posts)
+    if not texts:
+        return None, None, None, None
+
+    # Unchanged posts are served from the embedding cache; only new text is encoded.
+    with metrics.stage("encode"):
+        post_embeddings = embeddings.encode(texts, show_progress_bar=True)
+    config = topic_model_config(len(texts))
+    print(f"Fitting topics with {config}.")
+    topic_model = build_topic_model(config, post_embeddings.shape[1])
+    # fit_transform leaves the c-TF-IDF representation of the final (reduced) topics in place;
+    # labels are read from it directly instead of refitting the vectorizer with update_topics.
+    with metrics.stage("fit"):
+        topics, _ = topic_model.fit_transform(texts, post_embeddings)
+    return topic_model, topics, post_ids, texts
+
+def assign_topics_with_model(topic_model, posts):
+    """
+    Assign posts to the topics of an already fitted model without refitting.
+    BERTopic.transform routes HDBSCAN through approximate_predict on the saved prediction data.
+    Returns the list of topic IDs and the list of post IDs.
+    """
+    texts, post_ids = build_topic_texts(posts)
+    if not texts:
+        return [], []
+    post_embeddings = embeddings.encode(texts, show_progress_bar=True)
+    topics, _ = topic_model.transform(texts, post_embeddings)
+    return list(topics), post_ids
+
+MISCELLANEOUS_TERMS = [("miscellaneous", None)]
+
+def _label_terms(words):
+    terms = [(word, float(weight)) for word, weight in (words or [])[:3] if len(word) > 2]
+    return terms or MISCELLANEOUS_TERMS
+
+def topic_label_terms(topic_model):
+    """Label terms of every topic of a fitted model, read once from its c-TF-IDF: topic id -> terms."""
+    return {topic_num: _label_terms(words) for topic_num, words in topic_model.get_topics().items()}
+
+def write_topic_labels(topic_model, posts, topics, post_ids):
+    """Store the topic label of every post; posts left out of modeling become 'miscellaneous'."""
+    # Each label is resolved once per topic, then posts are mapped to it by topic id.
+    labels = topic_label_terms(topic_model)
+    terms_by_post = {
+        post_id: labels.get(topic_num, MISCELLANEOUS_TERMS) for post_id, topic_num in zip(post_ids, topics)
+    }
+    assignments = [
+        (post["id"], terms_by_post.get(post["id"], MISCELLANEOUS_TERMS))
+        for post in posts
+        if post["post_title"]
+    ]
+    update_topics(assignments)
+    print(f"Updated topics for {len(assignments)} posts.")
+
+def write_topic_details(topic_model, topics, post_ids, texts):
+    """
+    Replace the stored model topics: label, size, keyword weights and the posts BERTopic
+    picked as representative of each, for the topic summary pages.
+    """
+    sizes = Counter(int(topic_num) for topic_num in topics)
+    post_id_by_text = {}
+    for post_id, text in zip(post_ids, texts):
+        post_id_by_text.setdefault(text, post_id)
+    representative_docs = topic_model.get_representative_docs() or {}
+    details = []
+    for topic_num, words in topic_model.get_topics().items():
+        keywords = [(word, float(weight)) for word, weight in words or []]
+        representative = [
+            post_id_by_text[text] for text in representative_docs.get(topic_num) or [] if text in post_id_by_text
+        ]
+        label = ", ".join(word for word, _ in _label_terms(words))
+        details.append((int(topic_num), label, sizes.get(int(topic_num), 0), keywords, representative))
+    conn = db.get_connection()
+    with conn:
+        db.set_model_topics(conn, details)
+
+#############################################
+# Topic Model Persistence
+#############################################
+
+def topic_model_dir():
+    """TOPIC_MODEL_DIR for the default workspace, a directory inside the workspace otherwise."""
+    return db.workspace_path(TOPIC_MODEL_DIR, "topic_model")
+
+def save_topic_model_meta(meta):
+    model_dir = topic_model_dir()
+    os.makedirs(model_dir, exist_ok=True)
+    with open(os.path.join(model_dir, "meta.json"), "w") as f:
+        json.dump(meta, f)
+
+def save_topic_model(topic_model, fitted_docs):
+    """Pickle the fitted model (UMAP and HDBSCAN included) and record how many documents it saw."""
+    model_dir = topic_model_dir()
+    os.makedirs(model_dir, exist_ok=True)
+    topic_model.save(os.path.join(model_dir, "bertopic.pkl"), serialization="pickle", save_embedding_model=False)
+    save_topic_model_meta({"fitted_docs": fitted_docs, "assigned_since_fit": 0, "fitted_at": time.time()})
+    print(f"Saved topic model fitted on {fitted_docs} documents to {model_dir}.")
+
+def load_topic_model():
+    """Return (topic_model, metadata) for the saved model, or (None, None) if there is none."""
+    model_path = os.path.join(topic_model_dir(), "bertopic.pkl")
+    meta_path = os.path.join(topic_model_dir(), "meta.json")
+    if not (os.path.exists(model_path) and os.path.exists(meta_path)):
+        return None, None
+    from bertopic import BERTopic
+    try:
+        topic_model = BERTopic.load(model_path)
+        with open(meta_path) as f:
+            meta = json.load(f)
+    except Exception as e:
+        print("Could not load saved topic model, a full refit will be done:", e)
+        return None, None
+    return topic_model, meta
 
 def aggregate_topic_metrics(posts):
     """
@@ -245,14 +466,14 @@ def aggregate_topic_metrics(posts):
       - Total upvotes
       - Total posts
       - Total comments
-      - Average sentiment (on combined text)
-      - A simple summary (first 150 characters of concatenated texts)
+      - Average sentiment (mean of the stored per-post sentiment)
+      - A simple summary (first 150 characters of concatenated titles and contents)
     """
     topic_metrics = {}
     for post in posts:
         post_dict = dict(post)
-        combined_text = f"{post_dict['post_title']} {post_dict['post_content']} {post_dict['comments']}"
-        sentiment = TextBlob(combined_text).sentiment.polarity
+        combined_text = f"{post_dict['post_title']} {post_dict['post_content']}"
+        post_sentiment = post_dict.get("sentiment") or 0
         upvotes = post_dict['score'] if post_dict['score'] is not None else 0
         num_comments = post_dict['num_comments'] if post_dict['num_comments'] is not None else 0
 
@@ -273,12 +494,12 @@ def aggregate_topic_metrics(posts):
             topic_metrics[t]["total_upvotes"] += upvotes
             topic_metrics[t]["total_comments"] += num_comments
             topic_metrics[t]["total_posts"] += 1
-            topic_metrics[t]["sentiments"].append(sentiment)
+            topic_metrics[t]["sentiments"].append(post_sentiment)
             topic_metrics[t]["combined_texts"].append(combined_text)
 
-    for t, metrics in topic_metrics.items():
-        avg_sentiment = sum(metrics["sentiments"]) / len(metrics["sentiments"]) if metrics["sentiments"] else 0
-        combined_text = " ".join(metrics["combined_texts"])
+    for t, word_metrics in topic_metrics.items():
+        avg_sentiment = sum(word_metrics["sentiments"]) / len(word_metrics["sentiments"]) if word_metrics["sentiments"] else 0
+        combined_text = " ".join(word_metrics["combined_texts"])
         summary = combined_text[:150] + "..." if len(combined_text) > 150 else combined_text
         topic_metrics[t]["avg_sentiment"] = avg_sentiment
         topic_metrics[t]["summary"] = summary
@@ -288,57 +509,120 @@ def aggregate_topic_metrics(posts):
 # Main Function to Run Topic Modeling
 #############################################
 
-def run_topic_modeling(subreddit_name="LocalLLaMA", limit=50):
-    """
-    Clears the posts table, fetches new posts from the given subreddit,
-    runs topic modeling, and prints aggregated metrics to the console.
-    """
-    clear_posts_table()
-    ensure_posts_table_columns()
-
-    fetch_and_store_subreddit_posts(subreddit_name=subreddit_name, limit=limit)
+def refit_all_posts():
+    """Fit a new topic model over every stored post, relabel them all and save the model."""
     posts = get_posts()
     if not posts:
         print("No posts found in the database.")
-        return
+        return None
 
-    topic_model, topics, post_ids = perform_topic_modeling_on_posts(posts)
+    topic_model, topics, post_ids, texts = perform_topic_modeling_on_posts(posts)
     if topic_model is None or topics is None:
         print("No valid text found for topic modeling.")
-        return
+        return None
 
     print(topic_model.get_topic_info())
+    with metrics.stage("write_labels"):
+        write_topic_labels(topic_model, posts, topics, post_ids)
+        if TOPIC_SAVE_DETAILS:
+            write_topic_details(topic_model, topics, post_ids, texts)
+    with metrics.stage("save_model"):
+        save_topic_model(topic_model, fitted_docs=len(post_ids))
+    return topic_model
+
+def update_topics_incrementally():
+    """
+    Assign only new or changed posts through the saved model.
+    Falls back to a full refit when there is no saved model, when the posts assigned since
+    the last fit exceed REFIT_NEW_DOC_RATIO of the fitted corpus, or when too many of the
+    new posts come out as outliers.
+    """
+    new_posts = get_posts(only_unassigned=True)
+    if not new_posts:
+        print("No new posts to assign.")
+        return
 
-    # Map post IDs to indices for posts included in topic modeling.
-    post_id_to_index = {pid: idx for idx, pid in enumerate(post_ids)}
+    topic_model, meta = load_topic_model()
+    if topic_model is None:
+        print("No saved topic model found, fitting a new one.")
+        refit_all_posts()
+        return
 
-    for post in posts:
-        post_dict = dict(post)
-        if post_dict.get("post_title"):
-            if post_dict["id"] in post_id_to_index:
-                i = post_id_to_index[post_dict["id"]]
-                topic_num = topics[i]
-                topic_info = topic_model.get_topic(topic_num)
-                if topic_info:
-                    topic_words = [word for word, _ in topic_info[:3] if len(word) > 2]
-                    if topic_words:
-                        topic_category = ", ".join(topic_words)
-                    else:
-                        topic_category = "miscellaneous"
-                else:
-                    topic_category = "miscellaneous"
-            else:
-                topic_category = "miscellaneous"
-            update_topic(post_dict["id"], topic_category)
-            print(f"Updated post ID {post_dict['id']} with topic: {topic_category}")
-
-    aggregated_metrics = aggregate_topic_metrics(posts)
+    fitted_docs = meta.get("fitted_docs") or 0
+    assigned_since_fit = (meta.get("assigned_since_fit") or 0) + len(new_posts)
+    if assigned_since_fit > REFIT_NEW_DOC_RATIO * fitted_docs:
+        print(f"{assigned_since_fit} posts assigned since the last fit on {fitted_docs}, refitting.")
+        refit_all_posts()
+        return
+
+    topics, post_ids = assign_topics_with_model(topic_model, new_posts)
+    outlier_ratio = (sum(1 for t in topics if t == -1) / len(topics)) if topics else 0
+    if outlier_ratio > REFIT_OUTLIER_RATIO:
+        print(f"{outlier_ratio:.0%} of new posts are outliers, topics have drifted, refitting.")
+        refit_all_posts()
+        return
+
+    write_topic_labels(topic_model, new_posts, topics, post_ids)
+    meta["assigned_since_fit"] = assigned_since_fit
+    save_topic_model_meta(meta)
+    print(f"Assigned {len(new_posts)} new posts with the saved topic model.")
+
+def run_topic_modeling(subreddit_name="LocalLLaMA", limit=50, incremental=False, progress=no_progress):
+    """
+    Fetches new posts from the given subreddit, runs topic modeling,
+    and prints aggregated metrics to the console.
+
+    By default the stored posts are replaced by the fetched ones and the model is refit
+    from scratch. A fetch that returns no posts raises and leaves the stored posts untouched.
+    With incremental=True, posts are upserted by Reddit id and only new or changed posts
+    are assigned through the saved model, so each refresh costs in proportion to what is new.
+    Incremental runs skip posts whose score and comment count have not moved, and stop
+    after the fetch when no post needs a topic.
+
+    progress(stage, fraction, message) is called as each stage starts and, for the
+    fetch, after every stored batch; the background job runner records these.
+    """
+    progress("fetch", 0.0, "Fetching posts from Reddit")
+    with metrics.stage("fetch"):
+        stored = fetch_and_store_subreddit_posts(
+            subreddit_name=subreddit_name,
+            limit=limit,
+            progress=lambda stage, fraction=None, message=None: progress(stage, 0.4 * (fraction or 0), message),
+            skip_unchanged=incremental,
+            replace=not incremental
+        )
+    if not stored:
+        raise RuntimeError("No posts were fetched from Reddit; the stored posts were left unchanged.")
+    progress("sentiment", 0.45, "Scoring sentiment")
+    with metrics.stage("sentiment"):
+        score_missing_sentiment()
+
+    if incremental and not has_unassigned_posts() and vector_index.get_index() is not None:
+        print("No new or changed post text, skipping topic modeling and the index rebuild.")
+        return {"stored_posts": stored, "changed_posts": 0}
+
+    progress("topics", 0.5, "Running topic modeling")
+    with metrics.stage("topics"):
+        if incremental:
+            update_topics_incrementally()
+        elif refit_all_posts() is None:
+            return {"stored_posts": stored}
+
+    progress("index", 0.9, "Building the post vector index")
+    with metrics.stage("index"):
+        vector_index.build_index()
+
+    progress("aggregate", 0.95, "Aggregating topic metrics")
+    with metrics.stage("aggregate"):
+        posts = get_posts()
+        aggregated_metrics = aggregate_topic_metrics(posts)
     print("\nAggregated Topic Metrics:")
-    for topic, metrics in aggregated_metrics.items():
+    for topic, topic_metrics in aggregated_metrics.items():
         print(f"Topic: {topic}")
-        print(f"  Total Upvotes: {metrics['total_upvotes']}")
-        print(f"  Total Posts: {metrics['total_posts']}")
-        print(f"  Total Comments: {metrics['total_comments']}")
-        print(f"  Average Sentiment: {metrics['avg_sentiment']:.2f}")
-        print(f"  Summary: {metrics['summary']}")
+        print(f"  Total Upvotes: {topic_metrics['total_upvotes']}")
+        print(f"  Total Posts: {topic_metrics['total_posts']}")
+        print(f"  Total Comments: {topic_metrics['total_comments']}")
+        print(f"  Average Sentiment: {topic_metrics['avg_sentiment']:.2f}")
+        print(f"  Summary: {topic_metrics['summary']}")
         print("-" * 40)
+    return {"stored_posts": stored, "topics": len(aggregated_metrics)}
@@ -0,0 +1,283 @@
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+import db
+import embeddings
+import scoring
+
+# Built by run_topic_modeling; rebuilt whole each run (unchanged posts come from the embedding cache).
+VECTOR_INDEX_DIR = os.getenv("VECTOR_INDEX_DIR", "vector_index")
+# "numpy" (exact brute force, default), "hnswlib" or "faiss" (approximate, optional installs).
+VECTOR_INDEX_BACKEND = os.getenv("VECTOR_INDEX_BACKEND", "numpy").lower()
+HNSW_M = int(os.getenv("VECTOR_INDEX_HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("VECTOR_INDEX_HNSW_EF_CONSTRUCTION", "200"))
+HNSW_EF_SEARCH = int(os.getenv("VECTOR_INDEX_HNSW_EF_SEARCH", "64"))
+
+_loaded = {}  # index directory -> (meta.json mtime, VectorIndex)
+# Held while an index is loaded and while a build swaps its files in.
+_load_lock = threading.Lock()
+
+#############################################
+# Index Backends
+#############################################
+
+def index_dir():
+    """VECTOR_INDEX_DIR for the default workspace, a directory inside the workspace otherwise."""
+    return db.workspace_path(VECTOR_INDEX_DIR, "vector_index")
+
+def _path(name):
+    return os.path.join(index_dir(), name)
+
+class NumpyBackend:
+    """Exact inner-product search over the normalized vectors."""
+    name = "numpy"
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    def search(self, query, k):
+        scores = self.vectors @ query
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return top, scores[top]
+
+class HnswlibBackend:
+    name = "hnswlib"
+
+    def __init__(self, index):
+        self.index = index
+
+    @classmethod
+    def build(cls, vectors):
+        import hnswlib
+        index = hnswlib.Index(space="ip", dim=vectors.shape[1])
+        index.init_index(max_elements=len(vectors), ef_construction=HNSW_EF_CONSTRUCTION, M=HNSW_M)
+        index.add_items(vectors, np.arange(len(vectors)))
+        index.save_index(_path("hnswlib.bin.tmp"))
+        os.replace(_path("hnswlib.bin.tmp"), _path("hnswlib.bin"))
+
+    @classmethod
+    def load(cls, vectors):
+        import hnswlib
+        index = hnswlib.Index(space="ip", dim=vectors.shape[1])
+        index.load_index(_path("hnswlib.bin"), max_elements=len(vectors))
+        index.set_ef(max(HNSW_EF_SEARCH, 1))
+        return cls(index)
+
+    def search(self, query, k):
+        labels, distances = self.index.knn_query(query, k=min(k, self.index.get_current_count()))
+        # hnswlib's "ip" distance is 1 - inner product.
+        return labels[0], 1.0 - distances[0]
+
+class FaissBackend:
+    name = "faiss"
+
+    def __init__(self, index):
+        self.index = index
+
+    @classmethod
+    def build(cls, vectors):
+        import faiss
+        index = faiss.IndexHNSWFlat(vectors.shape[1], HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        index.add(vectors)
+        faiss.write_index(index, _path("faiss.index.tmp"))
+        os.replace(_path("faiss.index.tmp"), _path("faiss.index"))
+
+    @classmethod
+    def load(cls, vectors):
+        import faiss
+        index = faiss.read_index(_path("faiss.index"))
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+        return cls(index)
+
+    def search(self, query, k):
+        scores, labels = self.index.search(query[np.newaxis, :], min(k, self.index.ntotal))
+        keep = labels[0] >= 0
+        return labels[0][keep], scores[0][keep]
+
+ANN_BACKENDS = {
+    "hnswlib": HnswlibBackend,
+    "faiss": FaissBackend,
+}
+
+#############################################
+# Vector Index
+#############################################
+
+class VectorIndex:
+    """
+    Post embeddings (normalized, float32) with the matching post ids.
+    Unfiltered queries go through the configured backend; queries restricted to a set of
+    posts (one topic, say) are scored exactly over just those rows.
+    """
+
+    def __init__(self, post_ids, vectors, backend, meta):
+        self.post_ids = post_ids
+        self.vectors = vectors
+        self.backend = backend
+        self.meta = meta
+        self._row_of = {int(post_id): row for row, post_id in enumerate(post_ids)}
+
+    def __len__(self):
+        return len(self.post_ids)
+
+    def search(self, query_vector, k, candidate_ids=None):
+        """Return [(post_id, similarity)] for the k nearest posts, most similar first."""
+        if not len(self) or k <= 0:
+            return []
+        query = scoring.normalize_rows(query_vector)[0]
+        if candidate_ids is None:
+            rows, scores = self.backend.search(query, k)
+        else:
+            rows = np.array([self._row_of[pid] for pid in candidate_ids if pid in self._row_of], dtype=np.int64)
+            if not len(rows):
+                return []
+            found, scores = NumpyBackend(self.vectors[rows]).search(query, k)
+            rows = rows[found]
+        return [(int(self.post_ids[row]), float(score)) for row, score in zip(rows, scores)]
+
+def index_text(post):
+    """The text a post is indexed by: the same leading chunk discussion scoring encodes first."""
+    chunks = scoring.post_chunks(post, max_chunks=1)
+    return chunks[0] if chunks else ""
+
+def build_index(backend=None):
+    """
+    Encode every stored post and write the index to the workspace's index directory.
+    The plain vectors are always written, so the numpy backend can serve the index if the
+    ANN library is missing at query time. Returns the number of posts indexed.
+    """
+    backend = (backend or VECTOR_INDEX_BACKEND).lower()
+    conn = db.get_connection()
+    rows = conn.execute("SELECT id, post_title, post_content FROM posts ORDER BY id").fetchall()
+    # Comments are streamed a batch of posts at a time; only each post's first chunk is kept.
+    texts = [(post["id"], index_text(post)) for post in db.with_comments(conn, rows)]
+    texts = [(post_id, text) for post_id, text in texts if text]
+
+    start = time.perf_counter()
+    if texts:
+        vectors = scoring.normalize_rows(embeddings.encode([text for _, text in texts]))
+    else:
+        vectors = np.zeros((0, 0), dtype=np.float32)
+    post_ids = np.array([post_id for post_id, _ in texts], dtype=np.int64)
+
+    os.makedirs(index_dir(), exist_ok=True)
+    np.save(_path("post_ids.tmp.npy"), post_ids)
+    np.save(_path("vectors.tmp.npy"), vectors)
+
+    # Readers load under the same lock, so they never pair the new ids with the old
+    # vectors or ANN graph while the files are swapped one by one.
+    with _load_lock:
+        os.replace(_path("post_ids.tmp.npy"), _path("post_ids.npy"))
+        os.replace(_path("vectors.tmp.npy"), _path("vectors.npy"))
+
+        if backend in ANN_BACKENDS and len(texts):
+            try:
+                ANN_BACKENDS[backend].build(vectors)
+            except ImportError as e:
+                print(f"Vector index backend '{backend}' is not installed, using exact search: {e}")
+                backend = "numpy"
+        elif backend not in ANN_BACKENDS:
+            backend = "numpy"
+
+        # meta.json is written last; its mtime tells readers a new index is complete.
+        meta = {
+            "backend": backend,
+            "count": len(texts),
+            "model_name": embeddings.DEFAULT_MODEL_NAME,
+            "built_at": time.time(),
+            "build_seconds": round(time.perf_counter() - start, 3)
+        }
+        with open(_path("meta.json.tmp"), "w") as f:
+            json.dump(meta, f)
+        os.replace(_path("meta.json.tmp"), _path("meta.json"))
+    print(f"Indexed {len(texts)} posts with the {backend} backend in {meta['build_seconds']}s.")
+    return len(texts)
+
+def _load():
+    with open(_path("meta.json")) as f:
+        meta = json.load(f)
+    post_ids = np.load(_path("post_ids.npy"))
+    vectors = np.load(_path("vectors.npy"), mmap_mode="r")
+    backend = NumpyBackend(vectors)
+    if meta.get("backend") in ANN_BACKENDS and len(post_ids):
+        try:
+            backend = ANN_BACKENDS[meta["backend"]].load(vectors)
+        except (ImportError, OSError, RuntimeError) as e:
+            print(f"Could not load the {meta['backend']} index, using exact search: {e}")
+    return VectorIndex(post_ids, vectors, backend, meta)
+
+def get_index():
+    """The current workspace's on-disk index, reloaded after a rebuild; None before the first build."""
+    directory = index_dir()
+    try:
+        mtime = os.stat(_path("meta.json")).st_mtime_ns
+    except OSError:
+        return None
+    cached_mtime, index = _loaded.get(directory, (None, None))
+    if cached_mtime == mtime:
+        return index
+    with _load_lock:
+        cached_mtime, index = _loaded.get(directory, (None, None))
+        if cached_mtime != mtime:
+            index = _load()
+            _loaded[directory] = (mtime, index)
+    return index
+
+#############################################
+# Related-Post Retrieval
+#############################################
+
+def similar_posts(text, k=5, topic=None, query_vector=None, include_comments=False, label=None):
+    """
+    The k stored posts most semantically similar to text, most similar first, as dicts
+    with a 'similarity' key. With topic (one topic word), only posts tagged with that word
+    are considered; with label (a full 'a, b, c' posts.topic label), only posts with
+    exactly that label. include_comments adds each post's comment bodies as a "comments" list.
+    Pass query_vector when text has already been encoded. Returns [] before the index
+    has been built.
+    """
+    index = get_index()
+    if index is None or not len(index):
+        return []
+
+    conn = db.get_connection()
+    candidate_ids = None
+    if topic is not None:
+        candidate_ids = [row["post_id"] for row in conn.execute("""
+            SELECT pt.post_id
+            FROM topics t
+            JOIN post_topics pt ON pt.topic_id = t.id
+            WHERE t.name = ?
+        """, (topic,))]
+    elif label is not None:
+        candidate_ids = [row["id"] for row in conn.execute("SELECT id FROM posts WHERE topic = ?", (label,))]
+
+    if query_vector is None:
+        query_vector = embeddings.encode(text, use_cache=False)
+    hits = index.search(query_vector, k, candidate_ids)
+    if not hits:
+        return []
+    placeholders = ", ".join("?" for _ in hits)
+    rows = conn.execute(f"""
+        SELECT id, post_title, post_content, score, num_comments, topic, sentiment
+        FROM posts
+        WHERE id IN ({placeholders})
+    """, [post_id for post_id, _ in hits]).fetchall()
+    if include_comments:
+        rows = db.with_comments(conn, rows)
+    by_id = {row["id"]: dict(row) for row in rows}
+
+    # Posts deleted since the last build are skipped.
+    results = []
+    for post_id, similarity in hits:
+        if post_id in by_id:
+            by_id[post_id]["similarity"] = round(similarity, 4)
+            results.append(by_id[post_id])
+    return results